@@ -1,19 +1,31 @@
+import threading
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_google_genai import ChatGoogleGenerativeAI
-from tools import booking_tools, email_agent_tools
+from langchain_core.language_models import BaseChatModel
+import providers
+from tools import booking_tools, email_agent_tools, side_effect_tool_names
 
-def create_agent(llm: ChatGoogleGenerativeAI, tools: list, system_prompt: str):
+def create_agent(llm: BaseChatModel, tools: list, system_prompt: str):
+    from langchain.agents import create_tool_calling_agent, AgentExecutor
     prompt = ChatPromptTemplate.from_messages([
         ("system", system_prompt),
         MessagesPlaceholder(variable_name="messages"),
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
     agent = create_tool_calling_agent(llm, tools, prompt)
-    return AgentExecutor(agent=agent, tools=tools, verbose=True).with_config({"run_name": "agent"})
+    # Intermediate steps let callers see which tools a turn used (e.g. to skip caching side effects).
+    return AgentExecutor(agent=agent, tools=tools, return_intermediate_steps=True).with_config({"run_name": "agent"})
+
+def create_tool_calling_runnable(llm: BaseChatModel, tools: list, system_prompt: str):
+    """
+    Single LLM step with the tools bound. Unlike create_agent there is no inner loop:
+    the returned AIMessage carries the tool calls, which the graph's `tools` node executes.
+    """
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        MessagesPlaceholder(variable_name="messages"),
+    ])
+    return (prompt | llm.bind_tools(tools)).with_config({"run_name": "agent"})
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0.0)
-    
 system_prompt_suffix = """
 
 Your workflow for finding information must be as follows:
@@ -23,19 +35,50 @@ Your workflow for finding information must be as follows:
 4.  You must include the source URL of any information you provide.
 """
 
-AGENT_RUNNABLES = {
-    "FlightBooking": create_agent(llm, booking_tools,
+AGENT_SPECS = {
+    "FlightBooking": (booking_tools,
         "You are a specialized Flight Booking assistant. Find flight options and help the user book. Once complete, update the task status." + system_prompt_suffix),
-    "RestaurantBooking": create_agent(llm, booking_tools,
+    "RestaurantBooking": (booking_tools,
         "You are a specialized Restaurant Booking assistant. Find restaurants and table availability." + system_prompt_suffix),
-    "SpaBooking": create_agent(llm, booking_tools,
+    "SpaBooking": (booking_tools,
         "You are a specialized Spa Booking assistant. Find spa services and appointments." + system_prompt_suffix),
-    "BirthdayBooking": create_agent(llm, booking_tools,
+    "BirthdayBooking": (booking_tools,
         "You are a Birthday Planning assistant. Help find venues, gift ideas, and activities." + system_prompt_suffix),
-    "ConcertTicketsBooking": create_agent(llm, booking_tools,
+    "ConcertTicketsBooking": (booking_tools,
         "You are a Concert Tickets assistant. Find tickets for events and artists." + system_prompt_suffix),
-    "HotelReservation": create_agent(llm, booking_tools,
+    "HotelReservation": (booking_tools,
         "You are a Hotel Reservation assistant. Help the user find and book hotels for specific dates and guest counts." + system_prompt_suffix),
-    "EmailAutomation": create_agent(llm, email_agent_tools,
+    "EmailAutomation": (email_agent_tools,
         "You are an Email Automation assistant. You can summarize and draft emails.")
-}
\ No newline at end of file
+}
+
+AGENT_NAMES = list(AGENT_SPECS)
+# Agents whose answers come from the user's own data (their mailbox), never shareable across users.
+USER_SCOPED_AGENTS = {"EmailAutomation"}
+
+def used_side_effect_tools(result: dict) -> bool:
+    """Whether an AgentExecutor run called a tool that changes state."""
+    return any(action.tool in side_effect_tool_names for action, _ in result.get("intermediate_steps", []))
+
+# Built on first use per agent and shared afterwards, so importing this module constructs nothing.
+_agents = {}
+_tool_callers = {}
+_build_lock = threading.Lock()
+
+def _get_or_build(cache: dict, name: str, factory):
+    runnable = cache.get(name)
+    if runnable is None:
+        with _build_lock:
+            runnable = cache.get(name)
+            if runnable is None:
+                tools, prompt = AGENT_SPECS[name]
+                runnable = cache[name] = factory(providers.chat_model(), tools, prompt)
+    return runnable
+
+def get_agent(name: str):
+    """The AgentExecutor for `name`."""
+    return _get_or_build(_agents, name, create_agent)
+
+def get_tool_caller(name: str):
+    """The single-step bound-tools runnable for `name`."""
+    return _get_or_build(_tool_callers, name, create_tool_calling_runnable)
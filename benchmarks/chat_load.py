@@ -0,0 +1,96 @@
+"""
+Load benchmark for a running server: fires concurrent /chat requests and, while they
+are in flight, polls /offers-api/health to check the event loop stays responsive.
+
+    python -m benchmarks.chat_load --url http://127.0.0.1:8000 --concurrency 1 4 16
+"""
+import time
+import json
+import asyncio
+import argparse
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def _post_json(url: str, payload: dict, timeout: float) -> float:
+    data = json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        resp.read()
+    return time.perf_counter() - start
+
+def _get(url: str, timeout: float) -> float:
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        resp.read()
+    return time.perf_counter() - start
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+async def run_level(base_url: str, concurrency: int, requests_per_worker: int, agent_type: str, message: str, timeout: float) -> dict:
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=concurrency + 1)
+    chat_latencies, health_latencies, errors = [], [], 0
+    done = asyncio.Event()
+
+    async def worker():
+        nonlocal errors
+        for _ in range(requests_per_worker):
+            payload = {"message": message, "agent_type": agent_type}
+            try:
+                chat_latencies.append(await loop.run_in_executor(pool, _post_json, f"{base_url}/chat", payload, timeout))
+            except Exception as e:
+                errors += 1
+                print(f"Request failed: {e}")
+
+    async def health_probe():
+        while not done.is_set():
+            try:
+                health_latencies.append(await loop.run_in_executor(pool, _get, f"{base_url}/offers-api/health", timeout))
+            except Exception:
+                pass
+            await asyncio.sleep(0.1)
+
+    probe = asyncio.create_task(health_probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe
+    pool.shutdown()
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(chat_latencies),
+        "errors": errors,
+        "throughput_rps": len(chat_latencies) / elapsed if elapsed else 0.0,
+        "chat_p50_s": statistics.median(chat_latencies) if chat_latencies else 0.0,
+        "chat_p99_s": percentile(chat_latencies, 99),
+        "health_p99_ms": percentile(health_latencies, 99) * 1000,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Concurrent /chat load benchmark.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests-per-worker", type=int, default=2)
+    parser.add_argument("--agent-type", default="HotelReservation")
+    parser.add_argument("--message", default="Find me luxury hotels in Dubai")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    baseline = None
+    for level in args.concurrency:
+        result = await run_level(args.url, level, args.requests_per_worker, args.agent_type, args.message, args.timeout)
+        baseline = baseline or result["throughput_rps"]
+        result["speedup_vs_first"] = result["throughput_rps"] / baseline if baseline else 0.0
+        print(json.dumps(result))
+
+if __name__ == "__main__":
+    asyncio.run(main())
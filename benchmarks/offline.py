@@ -0,0 +1,164 @@
+"""
+Offline end-to-end benchmark: runs the app in-process against the deterministic fakes
+in fakes.py (PROVIDER_MODE=fake, so no network and no API keys) and reports p50/p99
+latency and throughput for /chat, /offers-api/offers and the offer refresh cycle.
+
+    python -m benchmarks.offline --scenarios chat offers refresh --concurrency 1 8 32 \\
+        --llm-latency 0.05 --search-latency 0.1 --failure-rate 0.01
+
+For "refresh" the concurrency is the number of queries per cycle. Provider rate limits
+still apply (GEMINI_RATE_PER_SECOND etc.), as they do in production.
+Everything runs in a temporary working directory, so local caches and databases are untouched.
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import asyncio
+import argparse
+import statistics
+import tempfile
+
+from benchmarks.chat_load import percentile
+
+def configure(args, workdir: str):
+    """Must run before any app module is imported: providers and paths are bound at import time."""
+    os.environ.update({
+        "PROVIDER_MODE": "fake",
+        "FAKE_LLM_LATENCY_SECONDS": str(args.llm_latency),
+        "FAKE_SEARCH_LATENCY_SECONDS": str(args.search_latency),
+        "FAKE_EMBED_LATENCY_SECONDS": str(args.embed_latency),
+        "FAKE_FAILURE_RATE": str(args.failure_rate),
+        "FAKE_SEED": str(args.seed),
+        "CHROMA_PATH": os.path.join(workdir, "chroma_data"),
+        "TRACE_SAMPLE_RATE": "0",
+    })
+    # The app modules are imported from the repo root, not from the temporary working directory.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(workdir)
+
+async def run_level(call, concurrency: int, requests_per_worker: int) -> dict:
+    latencies, errors = [], 0
+
+    async def worker(worker_id: int):
+        nonlocal errors
+        for n in range(requests_per_worker):
+            start = time.perf_counter()
+            try:
+                await call(worker_id, n)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors += 1
+                print(f"Request failed: {e!r}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": statistics.median(latencies) if latencies else 0.0,
+        "p99_s": percentile(latencies, 99),
+    }
+
+async def run_refresh_level(offer_service, queries_per_cycle: int, cycles: int, warm: bool) -> dict:
+    """Times `cycles` sequential refresh cycles of `queries_per_cycle` queries each."""
+    import providers
+    latencies, errors, refreshed = [], 0, 0
+    start = time.perf_counter()
+    for _ in range(cycles):
+        if not warm:
+            # New page content, so every result misses the enrichment cache as in a real refresh.
+            providers.offer_search_client().revision += 1
+        due = offer_service.refresh_scheduler.due(queries_per_cycle, now=time.time() + 10 ** 9)
+        cycle_start = time.perf_counter()
+        try:
+            await offer_service.refresh_queries(due)
+            latencies.append(time.perf_counter() - cycle_start)
+            refreshed += len(due)
+        except Exception as e:
+            errors += 1
+            print(f"Refresh cycle failed: {e!r}")
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": queries_per_cycle,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": refreshed / elapsed if elapsed else 0.0,
+        "p50_s": statistics.median(latencies) if latencies else 0.0,
+        "p99_s": percentile(latencies, 99),
+    }
+
+async def run(args):
+    import httpx
+    import main
+    import database
+    import offer_service
+    from graph import create_graph
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    await database.ainit_db()
+    await asyncio.to_thread(offer_service.offer_store.init)
+    # This process is the only worker, so it takes the refresher lease for the whole run.
+    await asyncio.to_thread(offer_service.offer_store.try_acquire_lease, offer_service.WORKER_ID, 24 * 3600)
+    scheduler = offer_service.refresh_scheduler
+    # Seed the catalog so get_available_offers and /offers have data to serve.
+    await offer_service.refresh_queries(scheduler.due(len(scheduler), now=time.time() + 10 ** 9))
+
+    async with AsyncSqliteSaver.from_conn_string("conversation_memory.sqlite") as memory:
+        main.app.state.agentic_graph = create_graph(checkpointer=memory)
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://offline", timeout=None) as client:
+
+            async def chat(worker_id: int, n: int):
+                payload = {"message": args.message, "agent_type": args.agent_type}
+                response = await client.post("/chat", json=payload)
+                response.raise_for_status()
+
+            async def offers(worker_id: int, n: int):
+                response = await client.get("/offers-api/offers")
+                response.raise_for_status()
+
+            for scenario in args.scenarios:
+                for level in args.concurrency:
+                    if scenario == "refresh":
+                        result = await run_refresh_level(offer_service, level, args.requests_per_worker, args.warm_enrichment)
+                    else:
+                        call = chat if scenario == "chat" else offers
+                        result = await run_level(call, level, args.requests_per_worker)
+                    print(json.dumps({"scenario": scenario, **result}))
+    database.close_db()
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against fake LLM, search and browser providers.")
+    parser.add_argument("--scenarios", nargs="+", choices=["chat", "offers", "refresh"], default=["chat", "offers", "refresh"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests-per-worker", type=int, default=5)
+    parser.add_argument("--agent-type", default="HotelReservation")
+    parser.add_argument("--message", default="Find me luxury hotels in Dubai")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--embed-latency", type=float, default=0.005)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm-enrichment", action="store_true", help="Keep page content stable between refresh cycles.")
+    parser.add_argument("--keep-workdir", action="store_true")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="offline-bench-")
+    configure(args, workdir)
+    try:
+        asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        if args.keep_workdir:
+            print(f"Working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
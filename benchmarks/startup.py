@@ -0,0 +1,85 @@
+"""
+Cold-start benchmark: imports the app in fresh interpreters and reports the import time,
+plus the slowest imports made directly by the app module (from `python -X importtime`).
+
+    python -m benchmarks.startup --runs 5 --budget-seconds 3
+
+Runs with PROVIDER_MODE=fake in a temporary working directory, so no API keys are needed
+and nothing local is touched. Exits with status 1 if the median exceeds --budget-seconds.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from benchmarks.chat_load import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_once(module: str, workdir: str) -> tuple:
+    """Imports `module` in a new interpreter. Returns (seconds, [(cumulative_us, name), ...] for its direct imports)."""
+    code = (
+        "import sys, time; sys.path.insert(0, %r); start = time.perf_counter(); "
+        "import %s; print(time.perf_counter() - start)" % (REPO_ROOT, module)
+    )
+    env = dict(os.environ, PROVIDER_MODE="fake", CHROMA_PATH=os.path.join(workdir, "chroma_data"))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=workdir, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    entries = []
+    for line in proc.stderr.splitlines():
+        # "import time:      self [us] |  cumulative | imported package"; nesting adds two spaces of indentation.
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((len(name) - len(name.lstrip()), int(cumulative), name.strip()))
+    # A module's line comes after the lines of everything it imported.
+    position = max(i for i, (_, _, name) in enumerate(entries) if name == module)
+    depth = entries[position][0]
+    imports = []
+    for entry_depth, cumulative, name in reversed(entries[:position]):
+        if entry_depth <= depth:
+            break
+        if entry_depth == depth + 2:
+            imports.append((cumulative, name))
+    return float(proc.stdout.strip().splitlines()[-1]), imports
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the app's cold import time.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    try:
+        timings = []
+        for _ in range(args.runs):
+            seconds, imports = import_once(args.module, workdir)
+            timings.append(seconds)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    median = statistics.median(timings)
+    result = {
+        "module": args.module,
+        "runs": args.runs,
+        "import_p50_s": median,
+        "import_p99_s": percentile(timings, 99),
+        "slowest_imports_s": {name: us / 1e6 for us, name in sorted(imports, reverse=True)[:args.top]},
+    }
+    if args.budget_seconds is not None:
+        result["budget_s"] = args.budget_seconds
+        result["within_budget"] = median <= args.budget_seconds
+    print(json.dumps(result, indent=2))
+    if args.budget_seconds is not None and median > args.budget_seconds:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import List, Optional
+
+import providers
+
+# We only read <img> src attributes from the DOM, so nothing beyond the HTML and the
+# scripts that set those attributes needs to be downloaded.
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet", "websocket", "eventsource", "manifest", "texttrack"}
+
+class BrowserPool:
+    """
+    One long-lived Chromium with a bounded set of reusable pages, plus a TTL cache of
+    scrape results per URL. Started lazily on first use; call `stop()` on shutdown.
+    If Chromium crashes or disconnects, the pool forgets it and relaunches on the next scrape.
+    """
+
+    def __init__(self, max_pages: int = 4, cache_ttl_seconds: int = 3600, cache_max_entries: int = 256,
+                 block_scripts: bool = False, timeout_ms: int = 10000):
+        self.max_pages = max_pages
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.cache_max_entries = cache_max_entries
+        self.timeout_ms = timeout_ms
+        self.blocked_types = BLOCKED_RESOURCE_TYPES | ({"script"} if block_scripts else set())
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._pages: Optional[asyncio.Queue] = None
+        self._pages_created = 0
+        self._start_lock = asyncio.Lock()
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def started(self) -> bool:
+        return self._browser is not None
+
+    async def _launch(self):
+        """Returns (playwright, browser)."""
+        # Imported on first scrape: most requests never need a browser.
+        from playwright.async_api import async_playwright
+        playwright = await async_playwright().start()
+        try:
+            return playwright, await playwright.chromium.launch()
+        except Exception:
+            await playwright.stop()
+            raise
+
+    async def start(self):
+        async with self._start_lock:
+            if self.started:
+                return
+            print("--- Launching shared Chromium for image scraping ---")
+            playwright, browser = await self._launch()
+            try:
+                context = await browser.new_context()
+                await context.route("**/*", self._route)
+            except Exception:
+                await self._close_quietly(playwright, browser)
+                raise
+            browser.on("disconnected", self._on_disconnected)
+            self._playwright, self._browser, self._context = playwright, browser, context
+            self._pages = asyncio.Queue()
+            self._pages_created = 0
+
+    def _on_disconnected(self, browser):
+        if browser is self._browser:
+            print("--- Chromium disconnected; it will be relaunched on the next scrape ---")
+            self._reset()
+
+    def _reset(self):
+        """Forgets the current browser so the next scrape launches a new one."""
+        playwright, browser, pages = self._playwright, self._browser, self._pages
+        self._playwright = self._browser = self._context = self._pages = None
+        self._pages_created = 0
+        if pages is not None:
+            # Wake everyone waiting for a page of the old browser; they retry against the new one.
+            for _ in range(self.max_pages):
+                pages.put_nowait(None)
+        if browser is not None:
+            asyncio.ensure_future(self._close_quietly(playwright, browser))
+
+    async def _close_quietly(self, playwright, browser):
+        try:
+            await browser.close()
+        except Exception:
+            pass
+        try:
+            await playwright.stop()
+        except Exception:
+            pass
+
+    async def stop(self):
+        async with self._start_lock:
+            if not self.started:
+                return
+            try:
+                await self._context.close()
+                await self._browser.close()
+            finally:
+                await self._playwright.stop()
+                self._playwright = self._browser = self._context = self._pages = None
+
+    async def _route(self, route):
+        if route.request.resource_type in self.blocked_types:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _acquire_page(self):
+        """(page, queue it belongs to); the queue tells _release_page whether the browser was reset meanwhile."""
+        while True:
+            if not self.started:
+                await self.start()
+            pages = self._pages
+            try:
+                page = pages.get_nowait()
+            except asyncio.QueueEmpty:
+                if self._pages_created < self.max_pages:
+                    self._pages_created += 1
+                    try:
+                        return await self._context.new_page(), pages
+                    except Exception:
+                        if pages is self._pages:
+                            self._pages_created -= 1
+                        raise
+                page = await asyncio.wait_for(pages.get(), self.timeout_ms / 1000)
+            # None marks a dropped page (or browser): its slot is free again, so loop and create a replacement.
+            if page is not None and pages is self._pages:
+                return page, pages
+
+    def _release_page(self, page, pages: Optional[asyncio.Queue], healthy: bool):
+        if pages is not self._pages:
+            return  # Belongs to a browser that was already reset.
+        if healthy:
+            pages.put_nowait(page)
+        else:
+            self._pages_created -= 1
+            asyncio.ensure_future(page.close())
+            pages.put_nowait(None)
+
+    def _cached(self, url: str) -> Optional[List[str]]:
+        entry = self._cache.get(url)
+        if entry is None:
+            return None
+        stored_at, images = entry
+        if time.time() - stored_at > self.cache_ttl_seconds:
+            del self._cache[url]
+            return None
+        self._cache.move_to_end(url)
+        return images
+
+    def _store(self, url: str, images: List[str]):
+        self._cache[url] = (time.time(), images)
+        self._cache.move_to_end(url)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+    async def scrape_images(self, url: str, limit: int = 10) -> List[str]:
+        """Up to `limit` unique absolute <img> URLs on the page. Raises on navigation errors or if no page frees up in time."""
+        cached = self._cached(url)
+        if cached is not None:
+            return cached[:limit]
+
+        page, pages = await self._acquire_page()
+        healthy = True
+        try:
+            await page.goto(url, wait_until="domcontentloaded", timeout=self.timeout_ms)
+            try:
+                await page.wait_for_selector("img", state="attached", timeout=2000)
+            except Exception:
+                pass
+            image_urls = await page.eval_on_selector_all("img", """(images) =>
+                images.map(img => img.src).filter(src => src.startsWith('http'))
+            """)
+        except Exception:
+            healthy = False
+            if self._browser is not None and not self._browser.is_connected():
+                self._reset()
+            raise
+        finally:
+            self._release_page(page, pages, healthy)
+
+        unique_urls = list(dict.fromkeys(image_urls))
+        self._store(url, unique_urls)
+        return unique_urls[:limit]
+
+browser_pool = providers.create_browser_pool(
+    max_pages=int(os.getenv("BROWSER_POOL_PAGES", "4")),
+    cache_ttl_seconds=int(os.getenv("SCRAPE_CACHE_TTL_SECONDS", "3600")),
+    block_scripts=os.getenv("BROWSER_BLOCK_SCRIPTS", "false").lower() == "true",
+)
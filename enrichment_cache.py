@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+def content_hash(item: Dict[str, Any]) -> str:
+    """Hash of the fields of a search result that enrichment reads."""
+    h = hashlib.sha256()
+    for field in ("title", "content", "raw_content"):
+        h.update((item.get(field) or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+class EnrichmentCache:
+    """
+    Summary + price output per (URL, content hash), so unchanged pages skip Gemini.
+    Entries expire after `ttl_seconds`; beyond `max_entries` the least recently used
+    entry is evicted. Persisted as a compact JSON file between restarts.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl_seconds: int = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(url: str, digest: str) -> str:
+        return f"{url}#{digest}"
+
+    def get(self, item: Dict[str, Any]) -> Optional[Tuple[str, dict]]:
+        """Returns the cached (summary, price_data) for this exact page content, or None."""
+        key = self._key(item.get("url", ""), content_hash(item))
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry["stored_at"] > self.ttl_seconds:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry["summary"], entry["price"]
+
+    def put(self, item: Dict[str, Any], summary: str, price_data: dict):
+        key = self._key(item.get("url", ""), content_hash(item))
+        self._entries[key] = {"summary": summary, "price": price_data, "stored_at": time.time()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = OrderedDict(json.load(f))
+        except Exception as e:
+            print(f"Could not load enrichment cache: {e}")
+
+    def save(self):
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, separators=(",", ":"))
+        except Exception as e:
+            print(f"Could not save enrichment cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,322 @@
+"""
+Deterministic offline stand-ins for the external providers, used when PROVIDER_MODE=fake
+(see providers.py) and by the benchmarks. Every fake takes a FaultInjector for latency
+and failure injection; outputs depend only on the inputs, never on the network.
+"""
+import os
+import re
+import math
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import threading
+import json
+import typing
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from search_cache import SearchBackend
+
+class ProviderFault(RuntimeError):
+    """Raised by a fake when the FaultInjector decides the call fails."""
+
+class FaultInjector:
+    """
+    Latency of `latency_seconds` +/- `jitter` (a fraction of the latency), and failures with
+    probability `failure_rate`. Draws come from one seeded RNG, so a run is reproducible.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency_seconds = latency_seconds
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            self.calls += 1
+            delay = self.latency_seconds * (1 + self.jitter * (2 * self._rng.random() - 1))
+            fail = self._rng.random() < self.failure_rate
+            self.failures += fail
+        return max(0.0, delay), fail
+
+    async def apply(self, what: str):
+        delay, fail = self._draw()
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise ProviderFault(f"Injected failure in {what}")
+
+    def apply_sync(self, what: str):
+        delay, fail = self._draw()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ProviderFault(f"Injected failure in {what}")
+
+def faults_from_env(prefix: str, default_latency: float) -> FaultInjector:
+    """FaultInjector configured by {prefix}_LATENCY_SECONDS / _FAILURE_RATE, with FAKE_* fallbacks."""
+    return FaultInjector(
+        latency_seconds=float(os.getenv(f"{prefix}_LATENCY_SECONDS", str(default_latency))),
+        jitter=float(os.getenv("FAKE_LATENCY_JITTER", "0.2")),
+        failure_rate=float(os.getenv(f"{prefix}_FAILURE_RATE", os.getenv("FAKE_FAILURE_RATE", "0"))),
+        seed=int(os.getenv("FAKE_SEED", "0")),
+    )
+
+def _digest(text: str) -> int:
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], 16)
+
+def _text(content: Any) -> str:
+    return content if isinstance(content, str) else str(content)
+
+# Arguments the fake model uses when it decides to call one of these tools (first bound one wins).
+DEFAULT_TOOL_ARGS = {
+    "get_available_offers": {"category": "HotelReservation", "location": "Dubai"},
+    "search_user_emails": {"query": "booking confirmation"},
+}
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers from the conversation itself. With tools bound, a fresh human
+    turn gets one tool call (see DEFAULT_TOOL_ARGS) and the tool result gets a final answer,
+    so agent loops take the same number of steps as with a real model.
+    `with_structured_output` fills the schema with deterministic values.
+    """
+
+    faults: Any = None
+    tool_args: Dict[str, dict] = DEFAULT_TOOL_ARGS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools: list, **kwargs):
+        return self.bind(tool_names=[convert_to_openai_tool(t)["function"]["name"] for t in tools], **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], tool_names: Optional[List[str]]) -> AIMessage:
+        last = messages[-1] if messages else HumanMessage(content="")
+        prompt_tokens = sum(len(_text(m.content)) for m in messages) // 4 + 1
+        message = None
+        if tool_names and isinstance(last, HumanMessage):
+            name = next((n for n in self.tool_args if n in tool_names), None)
+            if name is not None:
+                message = AIMessage(content="", tool_calls=[{"name": name, "args": dict(self.tool_args[name]), "id": f"call_{uuid.uuid4().hex[:12]}"}])
+        if message is None:
+            question = next((_text(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+            answer = f"Here is what I found for: {question[:200]}"
+            if isinstance(last, ToolMessage):
+                answer += f"\n\nSource data: {_text(last.content)[:500]}"
+            message = AIMessage(content=answer)
+        output_tokens = len(_text(message.content)) // 4 + 1
+        message.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": output_tokens,
+                                  "total_tokens": prompt_tokens + output_tokens}
+        return message
+
+    def _generate(self, messages, stop=None, run_manager=None, tool_names=None, **kwargs) -> ChatResult:
+        if self.faults is not None:
+            self.faults.apply_sync("chat model")
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, tool_names))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tool_names=None, **kwargs) -> ChatResult:
+        if self.faults is not None:
+            await self.faults.apply("chat model")
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, tool_names))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, tool_names=None, **kwargs):
+        """Streams the same response word by word, so streaming clients see token events."""
+        if self.faults is not None:
+            await self.faults.apply("chat model")
+        message = self._respond(messages, tool_names)
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=message.usage_metadata, tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ]))
+            return
+        words = re.findall(r"\S+\s*", message.content) or [""]
+        for n, word in enumerate(words):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=word, usage_metadata=message.usage_metadata if n == len(words) - 1 else None))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+
+    def with_structured_output(self, schema, **kwargs):
+        def to_text(value) -> str:
+            if hasattr(value, "to_messages"):
+                return "\n".join(_text(m.content) for m in value.to_messages())
+            if isinstance(value, list):
+                return "\n".join(_text(getattr(m, "content", m)) for m in value)
+            return _text(value)
+
+        def build(value):
+            return fake_instance(schema, to_text(value))
+
+        async def abuild(value):
+            if self.faults is not None:
+                await self.faults.apply("structured output")
+            return build(value)
+
+        return RunnableLambda(build, afunc=abuild)
+
+_LISTING_RE = re.compile(r"^\s*\[(\d+)\]", re.MULTILINE)
+
+def _fields(schema) -> Dict[str, Any]:
+    if hasattr(schema, "model_fields"):
+        return {name: field.annotation for name, field in schema.model_fields.items()}
+    return {name: field.outer_type_ for name, field in schema.__fields__.items()}
+
+def _fake_value(name: str, annotation: Any, prompt: str, position: int) -> Any:
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin is typing.Union:
+        annotation = next(a for a in args if a is not type(None))
+        origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin in (list, List):
+        # One entry per "[n]" listing in the prompt, as the enrichment prompts ask for.
+        count = len(_LISTING_RE.findall(prompt)) or 1
+        return [_fake_value(name, args[0], prompt, n) for n in range(count)]
+    seed = _digest(f"{prompt}|{name}|{position}")
+    if annotation is int:
+        return position if name == "index" else seed % 100
+    if annotation is float:
+        base = 50 + seed % 950
+        return float(base * 2) if "original" in name else float(base)
+    if annotation is str:
+        return "USD" if name == "currency" else f"Fake {name} {seed % 10000}."
+    if annotation is bool:
+        return bool(seed % 2)
+    if isinstance(annotation, type):
+        return fake_instance(annotation, prompt, position)
+    return None
+
+def fake_instance(schema, prompt: str, position: int = 0):
+    """A `schema` instance whose field values are derived from the prompt."""
+    values = {name: _fake_value(name, annotation, prompt, position) for name, annotation in _fields(schema).items()}
+    return schema(**values)
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: texts sharing words get a positive cosine similarity."""
+
+    def __init__(self, size: int = 256, faults: Optional[FaultInjector] = None):
+        self.size = size
+        self.faults = faults
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            h = _digest(word)
+            vector[h % self.size] += 1.0 if (h >> 20) % 2 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.faults is not None:
+            self.faults.apply_sync("embeddings")
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.faults is not None:
+            await self.faults.apply("embeddings")
+        return [self._embed(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+def fake_search_results(query: str, max_results: int = 4, revision: int = 0) -> List[Dict[str, Any]]:
+    """Listings with a price in the text, so the enrichment and validation steps have real work."""
+    results = []
+    for n in range(max_results):
+        seed = _digest(f"{query}|{n}")
+        price = 50 + seed % 950
+        slug = f"{seed:x}"
+        content = f"Special offer {n + 1} for {query}: now from ${price} USD per night, was ${price * 2}."
+        results.append({
+            "title": f"{query} - offer {n + 1}",
+            "url": f"https://offers.example.com/{slug}",
+            "content": content,
+            "raw_content": f"{content} Book by the end of the month. Revision {revision}.",
+            "score": round(1.0 - n * 0.1, 2),
+        })
+    return results
+
+class FakeTavilyClient:
+    """Blocking stand-in for TavilyClient.search. Bump `revision` to change page content between cycles."""
+
+    def __init__(self, faults: Optional[FaultInjector] = None):
+        self.faults = faults
+        self.revision = 0
+
+    def search(self, query: str, max_results: int = 5, include_images: bool = False, **kwargs) -> Dict[str, Any]:
+        if self.faults is not None:
+            self.faults.apply_sync("Tavily search")
+        results = fake_search_results(query, max_results, self.revision)
+        response = {"query": query, "results": results}
+        if include_images:
+            response["images"] = [f"https://images.example.com/{_digest(r['url']):x}.jpg" for r in results]
+        return response
+
+class FakeSearchBackend(SearchBackend):
+    """SearchBackend for web_search_tool with deterministic results and fault injection."""
+
+    def __init__(self, faults: Optional[FaultInjector] = None):
+        self.faults = faults
+        self.calls = 0
+
+    async def search(self, query: str) -> Any:
+        self.calls += 1
+        if self.faults is not None:
+            await self.faults.apply("web search")
+        return {"query": query, "results": fake_search_results(query)}
+
+class FakeImageExtractor:
+    """
+    Stand-in for image_extractor.extract_images. Pages whose URL hashes odd have no static
+    images, so scrape_page_for_images still falls back to the browser pool for some of them.
+    """
+
+    def __init__(self, faults: Optional[FaultInjector] = None):
+        self.faults = faults
+
+    def __call__(self, url: str, limit: int = 10) -> List[str]:
+        if self.faults is not None:
+            self.faults.apply_sync("image extraction")
+        seed = _digest(url)
+        if seed % 2:
+            return []
+        return [f"https://images.example.com/{seed:x}-og-{n}.jpg" for n in range(min(limit, 2))]
+
+class FakeBrowserPool:
+    """Same interface as BrowserPool; returns deterministic image URLs without launching Chromium."""
+
+    def __init__(self, faults: Optional[FaultInjector] = None):
+        self.faults = faults
+
+    @property
+    def started(self) -> bool:
+        return True
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def scrape_images(self, url: str, limit: int = 10) -> List[str]:
+        if self.faults is not None:
+            await self.faults.apply("browser scrape")
+        seed = _digest(url)
+        return [f"https://images.example.com/{seed:x}-{n}.jpg" for n in range(min(limit, 3))]
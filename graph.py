@@ -1,36 +1,170 @@
+import os
 from typing import TypedDict, Annotated, List
-from langchain_core.messages import BaseMessage, AIMessage
+from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, SystemMessage, RemoveMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages, REMOVE_ALL_MESSAGES
 from langgraph.prebuilt import ToolNode, tools_condition
-from agents import AGENT_RUNNABLES
+from agents import AGENT_NAMES, USER_SCOPED_AGENTS, get_agent, get_tool_caller, used_side_effect_tools
+from database import estimate_tokens
 from tools import all_tools 
+from offer_catalog import catalog
+import metrics
+import providers
+
+# Opt-in: answer repeated first questions from a semantic cache instead of re-running the agent.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+response_cache = None
+if RESPONSE_CACHE_ENABLED:
+    from response_cache import SemanticResponseCache
+    response_cache = SemanticResponseCache(
+        similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95")),
+        ttl_seconds=int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+        # Booking agents are named after their offer category, so a catalog refresh of that category invalidates its answers.
+        freshness=catalog.category_version,
+    )
+    metrics.cache_counters("response", response_cache.stats)
+
+# Context policy: once a thread's messages exceed CONTEXT_TOKEN_BUDGET (estimated tokens), the oldest
+# turns are folded into a rolling summary until the remaining window fits CONTEXT_KEEP_TOKENS.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+CONTEXT_KEEP_TOKENS = int(os.getenv("CONTEXT_KEEP_TOKENS", "3000"))
+# Tags the summarizer's LLM calls so streaming clients can tell them apart from the answer.
+CONTEXT_SUMMARY_TAG = "context_summary"
 
 class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], lambda x, y: x + y]
+    # add_messages appends like before, and also understands RemoveMessage for windowing.
+    messages: Annotated[List[BaseMessage], add_messages]
     agent_name: str
+    summary: str
+
+def context_messages(state: AgentState) -> List[BaseMessage]:
+    """The messages sent to the agent: the rolling summary (if any) followed by the recent window."""
+    summary = state.get("summary")
+    if not summary:
+        return state["messages"]
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + state["messages"]
+
+def split_window(messages: List[BaseMessage], keep_tokens: int) -> int:
+    """
+    Index where the kept window starts: the most recent messages that fit `keep_tokens`,
+    moved forward to a human turn so tool calls are never separated from their results.
+    The latest human turn is always kept.
+    """
+    used, start = 0, len(messages)
+    while start > 0 and used + estimate_tokens(messages[start - 1]) <= keep_tokens:
+        start -= 1
+        used += estimate_tokens(messages[start])
+    while start < len(messages) and not isinstance(messages[start], HumanMessage):
+        start += 1
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+    return min(start, last_human)
+
+async def summarize_messages(previous_summary: str, messages: List[BaseMessage], config: RunnableConfig = None) -> str:
+    transcript = "\n".join(
+        f"{m.type}: {m.content if isinstance(m.content, str) else m.content!r}" for m in messages
+    )
+    prompt = (
+        "You maintain a running summary of a conversation between a user and a booking/email assistant. "
+        "Keep every detail needed to continue: the user's goals, dates, locations, budgets, chosen options, "
+        "booking/task status and source URLs. Be concise.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New messages to fold in:\n{transcript}\n\nUpdated summary:"
+    )
+    response = await providers.chat_model().with_config(tags=[CONTEXT_SUMMARY_TAG]).ainvoke(prompt, config=config)
+    return response.content.strip() if isinstance(response.content, str) else str(response.content)
 
-def agent_node(state: AgentState):
-    """Invokes the agent selected by the router."""
+async def context_node(state: AgentState, config: RunnableConfig):
+    """Entry node: keeps the checkpointed message list within the context policy."""
+    messages = state["messages"]
+    if sum(estimate_tokens(m) for m in messages) <= CONTEXT_TOKEN_BUDGET:
+        return {}
+    start = split_window(messages, CONTEXT_KEEP_TOKENS)
+    if start == 0:
+        return {}
+    try:
+        with metrics.AGENT_NODE_SECONDS.time(node="context", agent=state["agent_name"]):
+            summary = await summarize_messages(state.get("summary", ""), messages[:start], config)
+    except Exception as e:
+        print(f"--- Context summarization failed, keeping full history: {e} ---")
+        return {}
+    print(f"--- Folded {start} older messages into the conversation summary ---")
+    # Older checkpoints may hold messages without ids, so replace the list wholesale rather than by id.
+    return {"summary": summary, "messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + messages[start:]}
+
+async def agent_node(state: AgentState, config: RunnableConfig):
+    """Invokes the agent selected by the router without blocking the event loop."""
+    with metrics.AGENT_NODE_SECONDS.time(node="executor", agent=state["agent_name"]):
+        return await _run_agent(state, config)
+
+async def _run_agent(state: AgentState, config: RunnableConfig):
     agent_name = state["agent_name"]
-    result = AGENT_RUNNABLES[agent_name].invoke({"messages": state["messages"]})
+    messages = state["messages"]
+    # Only the opening turn of a conversation is cached; later turns depend on the history.
+    # Answers built from a user's own data are never shared with other sessions.
+    embedding = None
+    if (response_cache is not None and agent_name not in USER_SCOPED_AGENTS
+            and len(messages) == 1 and not state.get("summary")):
+        try:
+            embedding = await response_cache.embed(messages[0].content)
+            cached = await response_cache.alookup(agent_name, embedding)
+            if cached is not None:
+                return {"messages": [AIMessage(content=cached, name=agent_name)]}
+        except Exception as e:
+            print(f"--- Response cache lookup failed: {e} ---")
+            embedding = None
+
+    result = await get_agent(agent_name).ainvoke({"messages": context_messages(state)}, config=config)
+    # A turn that changed state (e.g. updated a booking) must run again, not be replayed.
+    if embedding is not None and not used_side_effect_tools(result):
+        try:
+            await response_cache.astore(agent_name, embedding, result["output"])
+        except Exception as e:
+            print(f"--- Response cache store failed: {e} ---")
     return {"messages": [AIMessage(content=result["output"], name=agent_name)]}
 
+async def tool_calling_agent_node(state: AgentState, config: RunnableConfig):
+    """
+    One LLM step of the selected agent. Any tool calls in the response are routed by
+    `tools_condition` to the shared `tools` node, which runs them concurrently and
+    checkpoints the results before control returns to the agent.
+    """
+    agent_name = state["agent_name"]
+    with metrics.AGENT_NODE_SECONDS.time(node="tool_calling", agent=agent_name):
+        response = await get_tool_caller(agent_name).ainvoke({"messages": context_messages(state)}, config=config)
+    response.name = agent_name
+    return {"messages": [response]}
+
 tool_node = ToolNode(all_tools)
-agent_names = list(AGENT_RUNNABLES.keys())
+agent_names = AGENT_NAMES
+
+# "executor": each node runs a full AgentExecutor loop; "tool_calling": each node is a single
+# bound-tools LLM call and tool execution happens in the graph's `tools` node.
+GRAPH_MODE = os.getenv("AGENT_GRAPH_MODE", "executor")
+GRAPH_MODES = {"executor": agent_node, "tool_calling": tool_calling_agent_node}
 
 def router(state: AgentState) -> str:
     """Directs the conversation to the agent whose name is in the state."""
     return state["agent_name"]
 
-def create_graph(checkpointer):
+def create_graph(checkpointer, mode: str = None):
     """Factory function to create and compile the stateful graph."""
+    mode = mode or GRAPH_MODE
+    if mode not in GRAPH_MODES:
+        raise ValueError(f"Unknown graph mode '{mode}'. Valid options are: {list(GRAPH_MODES)}")
+    node = GRAPH_MODES[mode]
+
     workflow = StateGraph(AgentState)
     
+    workflow.add_node("context", context_node)
     workflow.add_node("tools", tool_node)
     for agent_name in agent_names:
-        workflow.add_node(agent_name, agent_node)
+        workflow.add_node(agent_name, node)
 
-    workflow.set_conditional_entry_point(
+    workflow.set_entry_point("context")
+    workflow.add_conditional_edges(
+        "context",
         router,
         {name: name for name in agent_names},
     )
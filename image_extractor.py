@@ -0,0 +1,145 @@
+import os
+import re
+import codecs
+import urllib.request
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from typing import List, Dict, Optional, Tuple
+
+MAX_HTML_BYTES = int(os.getenv("IMAGE_FETCH_MAX_BYTES", str(512 * 1024)))
+FETCH_TIMEOUT_SECONDS = float(os.getenv("IMAGE_FETCH_TIMEOUT_SECONDS", "5"))
+USER_AGENT = "Mozilla/5.0 (compatible; OfferImageBot/1.0)"
+_CHUNK_SIZE = 16 * 1024
+_SRCSET_WIDTH_RE = re.compile(r"^(\d+)w$")
+_SKIP_HINTS = ("sprite", "pixel", "spacer", "favicon", "/icons/", "logo")
+
+def _int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(str(value).strip().rstrip("px")) if value else None
+    except ValueError:
+        return None
+
+def _largest_srcset_candidate(srcset: str) -> Tuple[Optional[str], Optional[int]]:
+    best_url, best_width = None, None
+    for candidate in srcset.split(","):
+        parts = candidate.strip().split()
+        if not parts:
+            continue
+        width = None
+        if len(parts) > 1:
+            match = _SRCSET_WIDTH_RE.match(parts[1])
+            width = int(match.group(1)) if match else None
+        if best_url is None or (width or 0) > (best_width or 0):
+            best_url, best_width = parts[0], width
+    return best_url, best_width
+
+class ImageTagParser(HTMLParser):
+    """Collects candidate images from og:/twitter: meta tags and <img> src/data-src/srcset."""
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        # url -> {"width", "height", "meta"}
+        self.candidates: Dict[str, dict] = {}
+        # og:image URLs in document order with their declared sizes, applied in close().
+        self._og_images: List[dict] = []
+        # og:image:width/height seen before any og:image; some pages declare them first.
+        self._pending_size: Dict[str, Optional[int]] = {}
+
+    def _add(self, src: Optional[str], width: Optional[int] = None, height: Optional[int] = None,
+             meta: bool = False) -> Optional[str]:
+        if not src or src.startswith("data:"):
+            return None
+        url = urljoin(self.base_url, src.strip())
+        if not url.startswith(("http://", "https://")):
+            return None
+        entry = self.candidates.setdefault(url, {"width": None, "height": None, "meta": False})
+        entry["width"] = entry["width"] or width
+        entry["height"] = entry["height"] or height
+        entry["meta"] = entry["meta"] or meta
+        return url
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and attrs.get("href"):
+            self.base_url = urljoin(self.base_url, attrs["href"])
+        elif tag == "meta":
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            content = attrs.get("content")
+            if key in ("og:image", "og:image:url", "og:image:secure_url"):
+                url = self._add(content, meta=True)
+                if url is not None:
+                    self._og_images.append({"url": url, "width": self._pending_size.pop("width", None),
+                                            "height": self._pending_size.pop("height", None)})
+            elif key == "twitter:image":
+                self._add(content, meta=True)
+            elif key in ("og:image:width", "og:image:height"):
+                # Open Graph sizes describe the og:image declared before them.
+                dimension = key.rsplit(":", 1)[1]
+                if self._og_images and self._og_images[-1][dimension] is None:
+                    self._og_images[-1][dimension] = _int(content)
+                else:
+                    self._pending_size[dimension] = _int(content)
+        elif tag == "img":
+            width, height = _int(attrs.get("width")), _int(attrs.get("height"))
+            srcset = attrs.get("srcset") or attrs.get("data-srcset")
+            if srcset:
+                src, srcset_width = _largest_srcset_candidate(srcset)
+                self._add(src, srcset_width or width, height if not srcset_width else None)
+            else:
+                self._add(attrs.get("data-src") or attrs.get("src"), width, height)
+
+    def close(self):
+        super().close()
+        for og in self._og_images:
+            entry = self.candidates[og["url"]]
+            entry["width"] = entry["width"] or og["width"]
+            entry["height"] = entry["height"] or og["height"]
+
+def score_image(url: str, width: Optional[int], height: Optional[int], meta: bool) -> float:
+    """Higher is better: large declared area, photo-like aspect ratio, and page-level og:image."""
+    lowered = url.lower()
+    if any(hint in lowered for hint in _SKIP_HINTS) or lowered.split("?")[0].endswith((".svg", ".ico", ".gif")):
+        return 0.0
+    if (width and width < 100) or (height and height < 100):
+        return 0.0
+    if width and height:
+        area = width * height
+        aspect = width / height
+        if aspect > 4 or aspect < 0.25:
+            area *= 0.1
+    elif width or height:
+        area = (width or height) ** 2 * 0.6
+    else:
+        area = 400 * 300  # Undeclared size: rank below anything known to be large.
+    return area * (2.0 if meta else 1.0)
+
+def rank_images(candidates: Dict[str, dict], limit: int) -> List[str]:
+    scored = [(score_image(url, c["width"], c["height"], c["meta"]), url) for url, c in candidates.items()]
+    return [url for score, url in sorted(scored, key=lambda pair: pair[0], reverse=True) if score > 0][:limit]
+
+def extract_images(url: str, limit: int = 10, max_bytes: int = MAX_HTML_BYTES, timeout: float = FETCH_TIMEOUT_SECONDS) -> List[str]:
+    """
+    Fetches at most `max_bytes` of the page with a plain HTTP GET and parses it as it
+    streams in, returning up to `limit` image URLs ranked by `score_image`.
+    Returns an empty list if nothing usable is found; raises on HTTP/network errors.
+    """
+    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        content_type = resp.headers.get("Content-Type", "")
+        if "html" not in content_type and "xml" not in content_type:
+            return []
+        try:
+            decoder = codecs.getincrementaldecoder(resp.headers.get_content_charset() or "utf-8")(errors="ignore")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        parser = ImageTagParser(resp.geturl())
+        read = 0
+        while read < max_bytes:
+            chunk = resp.read(min(_CHUNK_SIZE, max_bytes - read))
+            if not chunk:
+                break
+            read += len(chunk)
+            parser.feed(decoder.decode(chunk))
+        parser.close()
+    return rank_images(parser.candidates, limit)
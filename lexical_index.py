@@ -0,0 +1,74 @@
+import re
+import math
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"[\w@.\-]+", re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; keeps identifiers like order numbers and email addresses whole."""
+    return [t.strip(".-") for t in _TOKEN_RE.findall((text or "").lower()) if t.strip(".-")]
+
+def is_identifier(token: str) -> bool:
+    """Tokens that are meant to be matched exactly: contain a digit or look like an email address."""
+    return any(c.isdigit() for c in token) or "@" in token
+
+class BM25Index:
+    """Small in-memory inverted index with Okapi BM25 scoring."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, doc_id: str, text: str, metadata: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            if doc_id in self.docs:
+                return
+            tokens = tokenize(text)
+            self.docs[doc_id] = (text, metadata or {})
+            self._lengths[doc_id] = len(tokens)
+            self._total_length += len(tokens)
+            for token, tf in Counter(tokens).items():
+                self._postings.setdefault(token, {})[doc_id] = tf
+
+    def document_frequency(self, token: str) -> int:
+        return len(self._postings.get(token, ()))
+
+    def search(self, query: str, k: int, predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Tuple[str, float]]:
+        """Top-k (doc_id, score) pairs; `predicate` filters on document metadata."""
+        scores: Dict[str, float] = {}
+        # Held while scoring: ingestion threads add postings concurrently.
+        with self._lock:
+            n = len(self.docs)
+            if not n:
+                return []
+            avgdl = self._total_length / n
+            for token in set(tokenize(query)):
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avgdl)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        if predicate is not None:
+            ranked = [(doc_id, score) for doc_id, score in ranked if predicate(self.docs[doc_id][1])]
+        return ranked[:k]
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merges several ranked id lists; ids ranked high in any list come first."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return [doc_id for doc_id, _ in sorted(scores.items(), key=lambda kv: kv[1], reverse=True)]
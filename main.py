@@ -1,19 +1,24 @@
 import uuid
+import time
+import json
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, Response, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langchain_core.messages import HumanMessage
 from fastapi.middleware.cors import CORSMiddleware
+from sse_starlette.sse import EventSourceResponse
 
 from graph import create_graph
 import database
+import metrics
+import vectorstore
 from offer_service import app as offer_app
-from agents import AGENT_RUNNABLES
-
-AGENT_NAMES = list(AGENT_RUNNABLES.keys())
+from agents import AGENT_NAMES
+from browser_pool import browser_pool
 
 def clean_agent_name(name: str) -> str:
     """Helper function to normalize agent names for comparison."""
@@ -37,48 +42,178 @@ def validate_agent_type(agent_type: str) -> str:
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    database.init_db()
+    await database.ainit_db()
     await offer_app.router.startup()
     async with AsyncSqliteSaver.from_conn_string("conversation_memory.sqlite") as memory:
         agentic_graph = create_graph(checkpointer=memory)
         app.state.agentic_graph = agentic_graph
         yield
     await offer_app.router.shutdown()
+    await browser_pool.stop()
+    database.close_db()
 
 app = FastAPI(title="Full Multi-Agent AI Platform", lifespan=lifespan)
 
 origins = ["http://localhost", "http://localhost:3000", "http://127.0.0.1:3000", "http://localhost:5173", "http://127.0.0.1:5173", "http://localhost:4200", "http://127.0.0.1:4200", "http://127.0.0.1:3901"]
-app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Next-Cursor", "ETag"])
 app.mount("/offers-api", offer_app, name="offers_api")
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Observes time to response headers (for SSE that is time to the first event, not the whole stream)."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The route template keeps path parameters and unknown URLs from creating unbounded label values.
+        route = request.scope.get("route")
+        path = request.scope.get("root_path", "") + route.path if route is not None else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=path, status=status)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of all registered metrics."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces")
+async def get_traces(limit: int = Query(20, ge=1, le=100)):
+    """The slowest recently sampled request traces (see TRACE_SAMPLE_RATE), each with its spans."""
+    return metrics.tracer.slowest(limit)
+
 class UserQuery(BaseModel):
     message: str
     session_id: str | None = None
     agent_type: str
 
+class Email(BaseModel):
+    id: str
+    content: str
+    sender: Optional[str] = None
+    date: Optional[str] = None
+
+class EmailUpload(BaseModel):
+    emails: List[Email]
+    session_id: str | None = None
+
+@app.post("/emails")
+async def upload_emails(upload: EmailUpload):
+    """
+    Adds emails to a chat session's mailbox, the only one the EmailAutomation agent searches
+    for that session. Without a `session_id` a new session is started; pass the returned id
+    to /chat. Re-uploading the same emails stores nothing new.
+    """
+    session_id = upload.session_id or str(uuid.uuid4())
+    metadatas = [{k: v for k, v in (("sender", e.sender), ("date", e.date)) if v} for e in upload.emails]
+    try:
+        added = await vectorstore.aingest_emails(
+            session_id, [e.content for e in upload.emails], [e.id for e in upload.emails], metadatas
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"session_id": session_id, "chunks_added": added}
+
 @app.get("/workflows", response_model=List[Dict[str, Any]])
-async def get_workflows():
-    return database.get_all_workflows()
+async def get_workflows(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str | None = None,
+    agent_name: str | None = None,
+    status: str | None = None,
+    include_details: bool = True,
+):
+    """
+    Lists workflows newest first, one page at a time.
+    When more rows exist, the cursor for the next page is returned in the `X-Next-Cursor` header.
+    """
+    try:
+        rows, next_cursor = await database.aget_workflows(limit, cursor, agent_name, status, include_details)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
-@app.post("/chat")
-async def handle_chat(request: Request, query: UserQuery):
-    agentic_graph = request.app.state.agentic_graph
+async def prepare_chat(query: UserQuery):
+    """Validates the request and builds the graph inputs and config for a chat turn."""
     session_id = query.session_id or str(uuid.uuid4())
     
     validated_agent_name = validate_agent_type(query.agent_type)
     
-    config = {"configurable": {"thread_id": session_id}}
+    # The email tools search the session's mailbox (filled through /emails). Requests are not
+    # authenticated: the session id is a random UUID the client echoes back, so whoever holds it
+    # can read that session's conversation and mailbox alike. A separate, guessable user id is not accepted.
+    config = {
+        "configurable": {"thread_id": session_id, "user_id": session_id},
+        "callbacks": metrics.request_callbacks(),
+    }
     inputs = {
         "messages": [HumanMessage(content=query.message)],
         "agent_name": validated_agent_name  
     }
     
-    if not database.workflow_exists(session_id):
-        database.create_workflow(session_id, validated_agent_name)
+    await database.acreate_workflow(session_id, validated_agent_name)
+    return session_id, validated_agent_name, config, inputs
+
+@app.post("/chat")
+async def handle_chat(request: Request, query: UserQuery):
+    agentic_graph = request.app.state.agentic_graph
+    session_id, validated_agent_name, config, inputs = await prepare_chat(query)
 
     final_state = await agentic_graph.ainvoke(inputs, config=config)
     ai_response_message = final_state["messages"][-1]
     response_content = ai_response_message.content
     agent_name = final_state.get("agent_name", validated_agent_name)
     response_data = {"session_id": session_id, "response": response_content, "agent_name": agent_name}
-    return JSONResponse(content=response_data)
\ No newline at end of file
+    return JSONResponse(content=response_data)
+
+@app.post("/chat/stream")
+async def handle_chat_stream(request: Request, query: UserQuery):
+    """
+    Same as /chat, but streams the run as Server-Sent Events:
+    `session` first, then `token`, `tool_start` and `tool_end` as they happen, and a final `done`,
+    or `error` if the run fails. If the client disconnects the run is cancelled.
+    """
+    agentic_graph = request.app.state.agentic_graph
+    session_id, validated_agent_name, config, inputs = await prepare_chat(query)
+
+    async def event_generator():
+        yield {"event": "session", "data": json.dumps({"session_id": session_id, "agent_name": validated_agent_name})}
+        stream = agentic_graph.astream_events(inputs, config=config, version="v2")
+        try:
+            async for event in stream:
+                if await request.is_disconnected():
+                    print(f"--- Client disconnected, cancelling run for session {session_id} ---")
+                    break
+                kind = event["event"]
+                # Only the agent's own output is the answer; the context node's summary is internal.
+                if kind == "on_chat_model_stream" and event.get("metadata", {}).get("langgraph_node") in AGENT_NAMES:
+                    content = event["data"]["chunk"].content
+                    if content:
+                        yield {"event": "token", "data": json.dumps({"content": content})}
+                elif kind == "on_tool_start":
+                    yield {"event": "tool_start", "data": json.dumps({"tool": event["name"], "input": event["data"].get("input")}, default=str)}
+                elif kind == "on_tool_end":
+                    yield {"event": "tool_end", "data": json.dumps({"tool": event["name"], "output": event["data"].get("output")}, default=str)}
+            else:
+                final_state = (await agentic_graph.aget_state(config)).values
+                response_data = {
+                    "session_id": session_id,
+                    "response": final_state["messages"][-1].content,
+                    "agent_name": final_state.get("agent_name", validated_agent_name),
+                }
+                yield {"event": "done", "data": json.dumps(response_data)}
+        except asyncio.CancelledError:
+            print(f"--- Stream for session {session_id} cancelled ---")
+            raise
+        except Exception as e:
+            print(f"--- Run failed for session {session_id}: {e!r} ---")
+            # The details stay in the server log; the client only learns that the run failed.
+            yield {"event": "error", "data": json.dumps({"session_id": session_id, "detail": "The agent failed to complete this request."})}
+        finally:
+            # Closing the event stream stops the graph run, so abandoned requests don't keep calling the LLM.
+            await stream.aclose()
+
+    return EventSourceResponse(event_generator())
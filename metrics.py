@@ -0,0 +1,284 @@
+import os
+import time
+import uuid
+import random
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "100"))
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # A callback metric is read at scrape time: it returns a number, or {label values tuple: number}.
+        self.callback = callback
+        self._values: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                print(f"--- Metric callback {self.name} failed: {e} ---")
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self._samples())
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; `observe` is O(log buckets) under a short lock."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time of the block, including when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Modules may be reloaded (e.g. by uvicorn --reload); the first registration wins.
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+registry = Registry()
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = (), callback=None) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames, callback))
+
+def gauge(name: str, documentation: str, labelnames: Tuple[str, ...] = (), callback=None) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames, callback))
+
+def histogram(name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+def cache_counters(cache_name: str, stats: Callable[[], Dict[str, Any]]):
+    """Exports a cache's `stats()` hit/miss counts, read at scrape time."""
+    counter(f"{cache_name}_cache_hits_total", f"Hits in the {cache_name} cache.", callback=lambda: stats()["hits"])
+    counter(f"{cache_name}_cache_misses_total", f"Misses in the {cache_name} cache.", callback=lambda: stats()["misses"])
+
+def executor_queue_depth(executor) -> int:
+    """Tasks waiting for a worker in a ThreadPoolExecutor."""
+    return executor._work_queue.qsize()
+
+HTTP_REQUEST_SECONDS = histogram("http_request_seconds", "HTTP request latency.", ("method", "route", "status"))
+AGENT_NODE_SECONDS = histogram("agent_node_seconds", "Latency of graph agent nodes.", ("node", "agent"))
+LLM_REQUEST_SECONDS = histogram("llm_request_seconds", "Latency of LLM calls.", ("component", "status"))
+LLM_TOKENS = histogram("llm_tokens", "Tokens per LLM call.", ("component", "direction"), TOKEN_BUCKETS)
+TOOL_SECONDS = histogram("tool_seconds", "Latency of agent tool calls.", ("tool", "status"))
+DB_QUERY_SECONDS = histogram("db_query_seconds", "Time database operations hold a pooled connection.", ("operation",))
+DB_POOL_WAIT_SECONDS = histogram("db_pool_wait_seconds", "Time spent waiting for a pooled database connection.")
+
+class Tracer:
+    """
+    Keeps the last `buffer_size` sampled traces (one per sampled request), each a list of
+    timed spans for the chains, LLM calls and tools that ran. Replaces verbose executor logging.
+    """
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, buffer_size: int = TRACE_BUFFER_SIZE):
+        self.sample_rate = sample_rate
+        self.traces: "deque[dict]" = deque(maxlen=buffer_size)
+
+    def sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def record(self, trace: dict):
+        self.traces.append(trace)
+
+    def slowest(self, limit: int = 20) -> List[dict]:
+        return sorted(self.traces, key=lambda t: t["duration_seconds"], reverse=True)[:limit]
+
+tracer = Tracer()
+
+def _run_name(serialized: Optional[dict], kwargs: dict, default: str) -> str:
+    if kwargs.get("name"):
+        return kwargs["name"]
+    if serialized:
+        return serialized.get("name") or (serialized.get("id") or [default])[-1]
+    return default
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback that records LLM latency/tokens and tool latency for every run,
+    and, when `sampled`, collects every run as a span and hands the finished trace to `tracer`.
+    """
+
+    run_inline = True
+
+    def __init__(self, component: str, sampled: bool = False):
+        self.component = component
+        self.sampled = sampled
+        self._runs: Dict[uuid.UUID, dict] = {}
+        self._spans: List[dict] = []
+        self._root: Optional[uuid.UUID] = None
+
+    def _start(self, kind: str, name: str, run_id, parent_run_id):
+        if self._root is None and parent_run_id is None:
+            self._root = run_id
+        self._runs[run_id] = {"kind": kind, "name": name, "start": time.perf_counter(), "wall": time.time(),
+                              "parent": str(parent_run_id) if parent_run_id else None}
+
+    def _end(self, run_id, status: str, **attributes) -> Optional[dict]:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        run["duration"] = time.perf_counter() - run["start"]
+        if self.sampled:
+            self._spans.append({
+                "span_id": str(run_id), "parent_id": run["parent"], "kind": run["kind"], "name": run["name"],
+                "start": run["wall"], "duration_seconds": round(run["duration"], 6), "status": status, **attributes,
+            })
+            if run_id == self._root:
+                tracer.record({"trace_id": str(run_id), "name": run["name"], "start": run["wall"],
+                               "duration_seconds": round(run["duration"], 6), "spans": self._spans})
+                self._spans, self._root = [], None
+        elif run_id == self._root:
+            self._root = None
+        return run
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if self.sampled or parent_run_id is None:
+            self._start("chain", _run_name(serialized, kwargs, "chain"), run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error", error=repr(error))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start("llm", _run_name(serialized, kwargs, "llm"), run_id, parent_run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start("llm", _run_name(serialized, kwargs, "chat_model"), run_id, parent_run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is not None and getattr(message, "usage_metadata", None):
+                    usage = message.usage_metadata
+        tokens_in, tokens_out = usage.get("input_tokens"), usage.get("output_tokens")
+        run = self._end(run_id, "ok", input_tokens=tokens_in, output_tokens=tokens_out)
+        if run is not None:
+            LLM_REQUEST_SECONDS.observe(run["duration"], component=self.component, status="ok")
+        if tokens_in is not None:
+            LLM_TOKENS.observe(tokens_in, component=self.component, direction="input")
+        if tokens_out is not None:
+            LLM_TOKENS.observe(tokens_out, component=self.component, direction="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._end(run_id, "error", error=repr(error))
+        if run is not None:
+            LLM_REQUEST_SECONDS.observe(run["duration"], component=self.component, status="error")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start("tool", _run_name(serialized, kwargs, "tool"), run_id, parent_run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        run = self._end(run_id, "ok")
+        if run is not None:
+            TOOL_SECONDS.observe(run["duration"], tool=run["name"], status="ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        run = self._end(run_id, "error", error=repr(error))
+        if run is not None:
+            TOOL_SECONDS.observe(run["duration"], tool=run["name"], status="error")
+
+def request_callbacks(component: str = "agent") -> List[BaseCallbackHandler]:
+    """Callbacks for one request's RunnableConfig; a `tracer.sample_rate` share of requests is traced."""
+    return [MetricsCallbackHandler(component, sampled=tracer.sample())]
@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import math
+import hashlib
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+DEFAULT_MAX_RESULTS = 5
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+def normalize_location(location: str) -> List[str]:
+    """Splits a free-form location ("Rome, Italy") into lowercase word tokens."""
+    return _TOKEN_RE.findall((location or "").lower())
+
+def price_bucket(price: Optional[float]) -> Optional[int]:
+    """Order-of-magnitude bucket for a price (0 -> <10, 1 -> <100, ...)."""
+    if not isinstance(price, (int, float)) or price <= 0:
+        return None
+    return max(0, int(math.log10(price)))
+
+def _compact(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+# Bookkeeping fields that change on every refresh without changing the offer itself.
+VOLATILE_FIELDS = ("fetched_at",)
+
+def _content(offer: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in offer.items() if k not in VOLATILE_FIELDS}
+
+def _fingerprint(payloads: Iterable[str]) -> str:
+    """Fingerprint of a category's serialized documents, as published to the OfferStore."""
+    return hashlib.sha1("\n".join(payloads).encode("utf-8")).hexdigest()[:16]
+
+class _CategorySegment:
+    """
+    One category's offers, their serialized documents and the indexes over them (ids are
+    positions within the segment). Immutable, so consecutive snapshots share the segments
+    of every category a refresh didn't change.
+    """
+
+    def __init__(self, category: Optional[str], offers: List[Dict[str, Any]], serialized: Optional[List[str]] = None):
+        self.category = category
+        self.offers: Tuple[Dict[str, Any], ...] = tuple(offers)
+        self.serialized: Tuple[str, ...] = tuple(serialized) if serialized is not None else tuple(_compact(o) for o in self.offers)
+        self.fingerprint = _fingerprint(self.serialized)
+        self.by_location_token: Dict[str, set] = {}
+        self.by_price_bucket: Dict[Tuple[str, int], set] = {}
+        self.locations: Tuple[str, ...] = tuple(o.get("location", "").lower() for o in self.offers)
+
+        for i, offer in enumerate(self.offers):
+            for token in normalize_location(offer.get("location", "")):
+                self.by_location_token.setdefault(token, set()).add(i)
+            currency = offer.get("currency")
+            bucket = price_bucket(offer.get("offer_price"))
+            if currency and bucket is not None:
+                self.by_price_bucket.setdefault((currency.upper(), bucket), set()).add(i)
+
+        # Changes only when a refresh changes what the offers say, not when it merely
+        # re-confirms them (so `fetched_at` is left out).
+        self.content_version = hashlib.sha1(
+            "\n".join(_compact(_content(o)) for o in self.offers).encode("utf-8")).hexdigest()[:16]
+
+def _segments(offers: List[Dict[str, Any]]) -> List[_CategorySegment]:
+    by_category: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for offer in offers:
+        by_category.setdefault(offer.get("category"), []).append(offer)
+    return [_CategorySegment(category, group) for category, group in by_category.items()]
+
+class _CatalogSnapshot:
+    """Immutable, ordered set of category segments."""
+
+    def __init__(self, segments: List[_CategorySegment], version: int = 0):
+        self.version = version
+        self.segments: Tuple[_CategorySegment, ...] = tuple(segments)
+        self.by_category: Dict[Optional[str], _CategorySegment] = {s.category: s for s in self.segments}
+        self.size = sum(len(s.offers) for s in self.segments)
+
+class OfferCatalog:
+    """
+    Indexed, read-optimized view over the current offers, grouped by category (catalog
+    order is each category's offers in turn, categories in order of first appearance).
+    A refresh builds a new snapshot and swaps it in with a single assignment, so readers
+    never observe a half-built index.
+    """
+
+    def __init__(self, offers: Optional[List[Dict[str, Any]]] = None, max_results: int = DEFAULT_MAX_RESULTS):
+        self.max_results = max_results
+        self._snapshot = _CatalogSnapshot(_segments(offers or []))
+
+    def replace(self, offers: List[Dict[str, Any]], version: Optional[int] = None):
+        """Rebuilds the indexes for `offers` and atomically publishes them."""
+        self._snapshot = _CatalogSnapshot(_segments(offers), self._next_version(version))
+
+    def load_from(self, store, version: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Publishes the given or latest OfferStore snapshot. Only categories whose fingerprint
+        differs from the current snapshot are read, parsed and indexed; the others share the
+        current segments. Returns the loaded version and the number of categories parsed.
+        """
+        current = {s.fingerprint: s for s in self._snapshot.segments}
+        version, categories = store.load(version, have=current.keys())
+        segments, parsed = [], 0
+        for category, category_fingerprint, payloads in categories:
+            if payloads is None:
+                segments.append(current[category_fingerprint])
+            else:
+                segments.append(_CategorySegment(category, [json.loads(p) for p in payloads], payloads))
+                parsed += 1
+        self._snapshot = _CatalogSnapshot(segments, version)
+        return version, parsed
+
+    def adopt(self, staged: "OfferCatalog", version: Optional[int] = None):
+        """Publishes the snapshot of a catalog built off to the side, without re-serializing or re-indexing it."""
+        snap = staged._snapshot
+        snap.version = self._next_version(version)
+        self._snapshot = snap
+
+    def _next_version(self, version: Optional[int]) -> int:
+        return self._snapshot.version + 1 if version is None else version
+
+    @property
+    def version(self) -> int:
+        """Version of the published snapshot: the OfferStore version, or a local counter."""
+        return self._snapshot.version
+
+    def segments(self) -> List[Tuple[Optional[str], str, List[str]]]:
+        """(category, fingerprint, compact JSON documents) per category, in catalog order."""
+        return [(s.category, s.fingerprint, list(s.serialized)) for s in self._snapshot.segments]
+
+    @property
+    def offers(self) -> List[Dict[str, Any]]:
+        return [offer for s in self._snapshot.segments for offer in s.offers]
+
+    def __len__(self) -> int:
+        return self._snapshot.size
+
+    def category_version(self, category: str) -> str:
+        """Opaque version of a category's offers; empty if the category has none."""
+        segment = self._snapshot.by_category.get(category)
+        return segment.content_version if segment is not None else ""
+
+    def find(self, category: str, location: str = "", currency: Optional[str] = None,
+             max_price: Optional[float] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Returns the matching offers, bounded by `limit` (defaults to `max_results`)."""
+        segment = self._snapshot.by_category.get(category)
+        if segment is None:
+            return []
+        return [segment.offers[i] for i in self._match(segment, location, currency, max_price, limit)]
+
+    def query(self, category: str, location: str = "", currency: Optional[str] = None,
+              max_price: Optional[float] = None, limit: Optional[int] = None) -> Optional[str]:
+        """Like `find`, but returns the matches as a compact JSON array, or None if nothing matched."""
+        segment = self._snapshot.by_category.get(category)
+        ids = self._match(segment, location, currency, max_price, limit) if segment is not None else []
+        if not ids:
+            return None
+        return "[" + ",".join(segment.serialized[i] for i in ids) + "]"
+
+    def select(self, category: Optional[str] = None, location: Optional[str] = None, currency: Optional[str] = None,
+               min_price: Optional[float] = None, max_price: Optional[float] = None) -> Tuple[int, List[str]]:
+        """
+        Every offer matching all the given filters, in catalog order, as compact JSON documents,
+        together with the version of the snapshot they came from. Price filters apply to
+        `offer_price` and exclude offers without one.
+        """
+        snap = self._snapshot
+        if category:
+            segments = [snap.by_category[category]] if category in snap.by_category else []
+        else:
+            segments = snap.segments
+        location = (location or "").strip().lower()
+        tokens = normalize_location(location)
+        currency = currency.upper() if currency else None
+        priced = min_price is not None or max_price is not None
+        selected = []
+        for segment in segments:
+            candidates = None
+            for token in tokens:
+                ids = segment.by_location_token.get(token, set())
+                candidates = ids if candidates is None else candidates & ids
+            for i in (sorted(candidates) if candidates is not None else range(len(segment.offers))):
+                offer = segment.offers[i]
+                if location and location not in segment.locations[i]:
+                    continue
+                if currency and (offer.get("currency") or "").upper() != currency:
+                    continue
+                if priced:
+                    price = offer.get("offer_price")
+                    if (not isinstance(price, (int, float)) or (min_price is not None and price < min_price)
+                            or (max_price is not None and price > max_price)):
+                        continue
+                selected.append(segment.serialized[i])
+        return snap.version, selected
+
+    def _match(self, segment: _CategorySegment, location: str, currency: Optional[str],
+               max_price: Optional[float], limit: Optional[int]) -> List[int]:
+        candidates = range(len(segment.offers))
+
+        location = (location or "").strip().lower()
+        tokens = normalize_location(location)
+        if tokens:
+            token_sets = [segment.by_location_token.get(t) for t in tokens]
+            if not all(token_sets):
+                return []
+            # Walk the (usually tiny) location posting list instead of the whole category.
+            allowed = set.intersection(*sorted(token_sets, key=len))
+            candidates = sorted(i for i in allowed if location in segment.locations[i])
+
+        if currency or max_price is not None:
+            currency = currency.upper() if currency else None
+            top_bucket = price_bucket(max_price) if max_price is not None else None
+            allowed = set()
+            for (cur, bucket), ids in segment.by_price_bucket.items():
+                if currency and cur != currency:
+                    continue
+                if top_bucket is not None and bucket > top_bucket:
+                    continue
+                allowed |= ids
+            candidates = (i for i in candidates if i in allowed)
+            if max_price is not None:
+                candidates = (i for i in candidates if segment.offers[i]["offer_price"] <= max_price)
+
+        limit = self.max_results if limit is None else limit
+        return list(islice(candidates, limit))
+
+# Shared by the offer service (which refreshes it) and the agent tools and response cache (which read it).
+catalog = OfferCatalog(max_results=int(os.getenv("OFFER_QUERY_MAX_RESULTS", "5")))
@@ -0,0 +1,119 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import brotli  # In requirements.txt; without it clients get gzip.
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; the headers would outweigh the savings.
+MIN_COMPRESS_BYTES = 1024
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    """'br', 'gzip' or 'identity': the best encoding the Accept-Encoding header allows."""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check with the weak comparison RFC 9110 requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any((tag[2:] if tag.startswith("W/") else tag) == bare
+               for tag in (t.strip() for t in if_none_match.split(",")))
+
+def make_etag(version: int, key: tuple) -> str:
+    # Weak, because the same representation is served with different content codings.
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+    return f'W/"v{version}-{digest}"'
+
+class PayloadCache:
+    """
+    Response bodies keyed by (snapshot version, request key), each built once and
+    compressed at most once per content coding. When a newer version shows up the
+    cache is emptied, so memory is bounded by `max_entries` bodies of the current version.
+    """
+
+    def __init__(self, max_entries: int = 256, gzip_level: int = 6, brotli_quality: int = 5):
+        self.max_entries = max_entries
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._version: Optional[int] = None
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _encode(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        if encoding == "gzip":
+            return gzip.compress(body, compresslevel=self.gzip_level)
+        return body
+
+    def _advance(self, version: int):
+        # Caller holds the lock.
+        if self._version is None or version > self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, version: int, key: tuple, build: Callable[[], Tuple[int, bytes, dict]],
+            encoding: str) -> Tuple[int, bytes, str, dict]:
+        """
+        (version, body, content coding, headers) for the request. `version` is the current
+        snapshot version as the caller read it. `build` is only called on a miss and returns the
+        version of the snapshot it actually read, the uncompressed body and any extra headers;
+        the body is cached under, and returned with, that version, so a refresh landing in
+        between never labels a body with the wrong version.
+        """
+        with self._lock:
+            self._advance(version)
+            entry = self._entries.get(key) if version == self._version else None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            built_version, body, headers = build()
+            entry = {"version": built_version, "headers": headers, "identity": body}
+            with self._lock:
+                self._advance(built_version)
+                if built_version == self._version:
+                    self._entries[key] = entry
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        body = entry["identity"]
+        if encoding == "identity" or len(body) < MIN_COMPRESS_BYTES:
+            return entry["version"], body, "identity", entry["headers"]
+        encoded = entry.get(encoding)
+        if encoded is None:
+            # Concurrent misses may both compress; the result is identical, so either copy is fine.
+            encoded = entry[encoding] = self._encode(body, encoding)
+        return entry["version"], encoded, encoding, entry["headers"]
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "version": self._version, "hits": self.hits, "misses": self.misses}
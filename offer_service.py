@@ -1,17 +1,26 @@
 import os
+import re
 import time
 import json
+import uuid
+import socket
 import asyncio
+import threading
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from tavily import TavilyClient
-tavily = TavilyClient(api_key=os.getenv("TAVILY_API_KEY", ""))
-from langchain_google_genai import ChatGoogleGenerativeAI
+from fastapi import FastAPI, Request, Response, HTTPException, Query
 from langchain_core.messages import HumanMessage
 from langchain_core.pydantic_v1 import BaseModel, Field
+import metrics
+import providers
+from offer_catalog import OfferCatalog, catalog
+from offer_store import OfferStore
+from offer_payloads import PayloadCache, make_etag, etag_matches, negotiate_encoding
+from throttling import ProviderLimiter
+from enrichment_cache import EnrichmentCache
+from refresh_scheduler import RefreshScheduler, ScheduledQuery, merge_offers
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 
@@ -21,47 +30,143 @@ GOOGLE_KEY = os.getenv("GOOGLE_API_KEY")
 print("ENV CHECK: TAVILY_API_KEY present?", bool(TAVILY_KEY))
 print("ENV CHECK: GOOGLE_API_KEY present?", bool(GOOGLE_KEY))
 
-if not TAVILY_KEY or not GOOGLE_KEY:
-    raise RuntimeError("Please set TAVILY_API_KEY and GOOGLE_API_KEY in .env")
+providers.require_keys("TAVILY_API_KEY", "GOOGLE_API_KEY")
 
 class Price(BaseModel):
     original_price: Optional[float] = Field(description="The numerical value of the standard/list/original price. Null if not found.")
     offer_price: Optional[float] = Field(description="The numerical value of the sale/discounted/'starting from' price. Null if not found.")
     currency: Optional[str] = Field(description="The 3-letter ISO currency code for the prices found (e.g., 'USD', 'EUR', 'SAR').")
 
-summarize_llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0.0)
-structured_llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0.0).with_structured_output(Price)
+class ListingEnrichment(BaseModel):
+    index: int = Field(description="The [n] number of the listing this entry describes.")
+    summary: str = Field(description="One concise sentence summarizing the listing.")
+    original_price: Optional[float] = Field(description="The numerical value of the standard/list/original price. Null if not found.")
+    offer_price: Optional[float] = Field(description="The numerical value of the sale/discounted/'starting from' price. Null if not found.")
+    currency: Optional[str] = Field(description="The 3-letter ISO currency code for the prices found (e.g., 'USD', 'EUR', 'SAR').")
+
+class EnrichmentBatch(BaseModel):
+    listings: List[ListingEnrichment] = Field(description="Exactly one entry per listing, in the order given.")
+
+# Records latency and token usage of every enrichment call under component="offer_enrichment".
+_llm_metrics = [metrics.MetricsCallbackHandler("offer_enrichment")]
+# Views over the shared chat client, built on first use.
+@providers.singleton
+def summarize_llm():
+    return providers.chat_model().with_config(callbacks=_llm_metrics)
+
+@providers.singleton
+def structured_llm():
+    return providers.chat_model().with_structured_output(Price).with_config(callbacks=_llm_metrics)
 
+@providers.singleton
+def batch_enrich_llm():
+    return providers.chat_model().with_structured_output(EnrichmentBatch).with_config(callbacks=_llm_metrics)
+
+# Legacy per-process cache; imported into the shared offer store once, if the store is empty.
 CACHE_FILE = "offers_cache.json"
 POLL_INTERVAL_SECONDS = int(os.getenv("POLL_INTERVAL_SECONDS", "3600"))
+# The scheduler wakes at least this often and refreshes at most REFRESH_BATCH_SIZE due queries per tick.
+SCHEDULER_TICK_SECONDS = int(os.getenv("SCHEDULER_TICK_SECONDS", "60"))
+REFRESH_BATCH_SIZE = int(os.getenv("REFRESH_BATCH_SIZE", "8"))
+# Offers that no refresh has confirmed for this long are dropped from the catalog.
+OFFER_MAX_AGE_SECONDS = int(os.getenv("OFFER_MAX_AGE_SECONDS", str(POLL_INTERVAL_SECONDS * 12)))
+# A (category, location) lookup missed this many times (after decay) gets its own refresh query,
+# up to MAX_PROMOTED_QUERIES of them.
+MISS_PROMOTION_THRESHOLD = float(os.getenv("MISS_PROMOTION_THRESHOLD", "3"))
+MAX_PROMOTED_QUERIES = int(os.getenv("MAX_PROMOTED_QUERIES", "20"))
+TAVILY_CONCURRENCY = int(os.getenv("TAVILY_CONCURRENCY", "4"))
+TAVILY_RATE_PER_SECOND = float(os.getenv("TAVILY_RATE_PER_SECOND", "2"))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "8"))
+GEMINI_RATE_PER_SECOND = float(os.getenv("GEMINI_RATE_PER_SECOND", "4"))
+tavily_limiter = ProviderLimiter("Tavily", TAVILY_CONCURRENCY, TAVILY_RATE_PER_SECOND)
+gemini_limiter = ProviderLimiter("Gemini", GEMINI_CONCURRENCY, GEMINI_RATE_PER_SECOND)
+# The Tavily client is blocking; its calls get their own pool sized to the provider limit.
+_search_executor = ThreadPoolExecutor(max_workers=TAVILY_CONCURRENCY, thread_name_prefix="tavily")
+# "separate": one summary call and one price call per result.
+# "batched": one structured call returns summary + prices for ENRICH_BATCH_SIZE results,
+#            sending only the price-bearing passages of each page.
+ENRICHMENT_MODE = os.getenv("ENRICHMENT_MODE", "separate")
+ENRICH_BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "5"))
+PRICE_PASSAGE_MAX_CHARS = int(os.getenv("PRICE_PASSAGE_MAX_CHARS", "1500"))
+# Only the worker holding the refresher lease refreshes offers; it renews the lease every tick,
+# and another worker takes over once a lease is REFRESHER_LEASE_SECONDS old.
+# The other workers check the store for a new snapshot every OFFER_STORE_POLL_SECONDS.
+REFRESHER_LEASE_SECONDS = int(os.getenv("REFRESHER_LEASE_SECONDS", str(max(180, 3 * SCHEDULER_TICK_SECONDS))))
+OFFER_STORE_POLL_SECONDS = float(os.getenv("OFFER_STORE_POLL_SECONDS", "5"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
 app = FastAPI(title="Offer Library Service (Gemini + Tavily)")
-_offers: List[Dict[str, Any]] = []
+offer_store = OfferStore()
+_is_refresher = False
+_update_task: Optional[asyncio.Task] = None
+# Lookups recorded by this worker since the last tick: (category, location) -> (demand, misses).
+_pending_demand: Dict[tuple, tuple] = {}
+_pending_demand_lock = threading.Lock()
+enrichment_cache = EnrichmentCache(
+    os.getenv("ENRICHMENT_CACHE_FILE", "enrichment_cache.json"),
+    max_entries=int(os.getenv("ENRICHMENT_CACHE_MAX_ENTRIES", "5000")),
+    ttl_seconds=int(os.getenv("ENRICHMENT_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+)
+
+REFRESH_CYCLE_SECONDS = metrics.histogram("offer_refresh_cycle_seconds", "Duration of one offer refresh tick.")
+OFFER_LOOKUPS = metrics.counter("offer_lookups_total", "get_available_offers lookups by result.", ("result",))
+metrics.gauge("offer_catalog_size", "Offers in the catalog.", callback=lambda: len(catalog))
+metrics.gauge("offer_catalog_version", "Offer store version loaded by this worker.", callback=lambda: catalog.version)
+metrics.gauge("offer_refresher", "1 if this worker holds the offer refresher lease.", callback=lambda: int(_is_refresher))
+metrics.gauge("offer_refresh_queries", "Queries tracked by the refresh scheduler.", callback=lambda: len(refresh_scheduler))
+metrics.cache_counters("enrichment", lambda: enrichment_cache.stats())
+
+# Encoded /offers bodies for the current catalog version, one per distinct filter and page.
+offers_payloads = PayloadCache(max_entries=int(os.getenv("OFFERS_PAYLOAD_CACHE_ENTRIES", "256")))
+metrics.cache_counters("offers_payload", offers_payloads.stats)
 
-def load_cache():
-    global _offers
+def load_legacy_cache() -> List[Dict[str, Any]]:
     if os.path.exists(CACHE_FILE):
         try:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f: _offers = json.load(f)
+            with open(CACHE_FILE, "r", encoding="utf-8") as f: return json.load(f)
         except Exception as e: print(f"Could not load cache: {e}")
+    return []
 
-def save_cache():
-    try:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f: json.dump(_offers, f, ensure_ascii=False, indent=2)
-    except Exception as e: print(f"Could not save cache: {e}")
+def sync_catalog():
+    """Loads the latest store snapshot into this worker's catalog if it changed."""
+    version = offer_store.version()
+    if version and version != catalog.version:
+        version, parsed = catalog.load_from(offer_store, version)
+        print(f"--- Loaded offer snapshot v{version}: {len(catalog)} offers, {parsed} changed categories parsed ---")
+
+def publish_offers(offers: List[Dict[str, Any]]) -> bool:
+    """Publishes `offers` to the store and this worker's catalog. False if the refresher lease was lost."""
+    staged = OfferCatalog(offers)
+    version = offer_store.publish(staged.segments(), WORKER_ID)
+    if version is None:
+        print("--- Lost the offer refresher lease; discarding this refresh ---")
+        return False
+    catalog.adopt(staged, version)
+    return True
+
+def take_pending_demand() -> Dict[tuple, tuple]:
+    global _pending_demand
+    with _pending_demand_lock:
+        pending, _pending_demand = _pending_demand, {}
+    return pending
+
+class EnrichmentError(Exception):
+    """A Gemini enrichment call failed (after retries); the result must not be cached."""
+
+EMPTY_PRICE = {"original_price": None, "offer_price": None, "currency": None}
 
 async def summarize_with_gemini_async(text: str) -> str:
+    """One-sentence summary of `text`; raises EnrichmentError if the call fails."""
     if not text: return ""
     prompt = f"Summarize the following in one concise sentence for a listing:\n\n{text}"
     try:
-        resp = await summarize_llm.ainvoke(prompt)
-        return resp.content.strip()
+        resp = await gemini_limiter.call(lambda: summarize_llm().ainvoke(prompt))
     except Exception as e:
-        print(f"Gemini async summarization failed: {e}")
-        return ""
+        raise EnrichmentError(f"Gemini async summarization failed: {e}") from e
+    return resp.content.strip()
 
-async def extract_prices_with_gemini_async(text: str, retries: int = 2) -> dict:
-    default_price = {"original_price": None, "offer_price": None, "currency": None}
-    if not text: return default_price
+async def extract_prices_with_gemini_async(text: str) -> dict:
+    """Price fields found in `text` (None where absent); raises EnrichmentError if the call fails."""
+    if not text: return dict(EMPTY_PRICE)
     prompt = f"""
     You are an expert data extraction assistant. Analyze the text to identify price information.
     RULES:
@@ -72,23 +177,191 @@ async def extract_prices_with_gemini_async(text: str, retries: int = 2) -> dict:
     5. Ignore non-monetary values like "points". If a value is not found, it must be null.
     Text to analyze: --- {text} ---
     """
-    for attempt in range(retries):
-        try:
-            price_model = await structured_llm.ainvoke(prompt)
-            if price_model: return price_model.dict()
-        except Exception as e:
-            print(f"Gemini price extraction attempt {attempt + 1} failed: {e}")
-            if attempt < retries - 1: await asyncio.sleep(1)
-    return default_price
+    try:
+        price_model = await gemini_limiter.call(lambda: structured_llm().ainvoke(prompt))
+    except Exception as e:
+        raise EnrichmentError(f"Gemini price extraction failed: {e}") from e
+    if not price_model:
+        raise EnrichmentError("Gemini price extraction returned no structured output.")
+    return price_model.dict()
+
+_PRICE_HINT_RE = re.compile(
+    r"[$€£¥₹]|\b(?:USD|EUR|GBP|SAR|AED|QAR|JPY|AUD|SGD|THB|KRW|HUF|MXN|IDR|INR|CAD|CHF)\b"
+    r"|\b(?:price|prices|from|per night|sale|discount|rate|rates|fare|fares|cost|riyals?|dirhams?|euros?|dollars?)\b",
+    re.IGNORECASE,
+)
+_PASSAGE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def extract_price_passages(text: str, max_chars: int = PRICE_PASSAGE_MAX_CHARS) -> str:
+    """
+    Keeps only the sentences/lines of a page that contain a number next to a currency or
+    price word, up to `max_chars`. Falls back to the start of the text if none match.
+    """
+    if not text:
+        return ""
+    kept, size = [], 0
+    for passage in _PASSAGE_SPLIT_RE.split(text):
+        passage = passage.strip()
+        if not passage or not any(c.isdigit() for c in passage) or not _PRICE_HINT_RE.search(passage):
+            continue
+        if size + len(passage) > max_chars:
+            break
+        kept.append(passage)
+        size += len(passage) + 1
+    return "\n".join(kept) if kept else text[:max_chars]
+
+async def enrich_separately_async(item: Dict[str, Any]) -> tuple:
+    """
+    (summary, price_data, complete) for one result via two independent calls. A failed call
+    leaves an empty summary or empty prices and sets `complete` to False.
+    """
+    summary, price_data = await asyncio.gather(
+        summarize_with_gemini_async(item.get("content", "")),
+        extract_prices_with_gemini_async(item.get("raw_content", item.get("content", ""))),
+        return_exceptions=True,
+    )
+    complete = True
+    if isinstance(summary, Exception):
+        print(summary)
+        summary, complete = "", False
+    if isinstance(price_data, Exception):
+        print(price_data)
+        price_data, complete = dict(EMPTY_PRICE), False
+    return summary, price_data, complete
+
+async def enrich_batch_with_gemini_async(items: List[Dict[str, Any]]) -> List[tuple]:
+    """
+    Summary and price data for several results with one structured Gemini call.
+    Falls back to per-result calls if the batched response fails or is incomplete.
+    """
+    listings = []
+    for n, item in enumerate(items):
+        passages = extract_price_passages(item.get("raw_content") or item.get("content", ""))
+        listings.append(f"[{n}] {item.get('title', '')}\nDescription: {item.get('content', '')}\nPrice passages: {passages}")
+    prompt = f"""
+    You are an expert data extraction assistant. For EACH numbered listing below, return one entry with its index,
+    a one-sentence summary of the listing, and its price information.
+    PRICE RULES:
+    1. Find 'offer_price' (e.g., "from $99", "sale €50"). This is most important.
+    2. Find 'original_price' if it is also mentioned (e.g., a crossed-out list price).
+    3. Extract only numerical values (e.g., 99.0, 50).
+    4. You MUST identify the 3-letter ISO currency code (e.g., 'USD', 'EUR', 'SAR'). If you find a price but cannot determine the currency, all price fields must be null.
+    5. Ignore non-monetary values like "points". If a value is not found, it must be null.
+    Listings:
+    {chr(10).join(listings)}
+    """
+    try:
+        batch = await gemini_limiter.call(lambda: batch_enrich_llm().ainvoke(prompt))
+        by_index = {entry.index: entry for entry in (batch.listings if batch else [])}
+        if all(n in by_index for n in range(len(items))):
+            return [
+                (by_index[n].summary.strip(), {
+                    "original_price": by_index[n].original_price,
+                    "offer_price": by_index[n].offer_price,
+                    "currency": by_index[n].currency,
+                }, True)
+                for n in range(len(items))
+            ]
+        print(f"Gemini batch enrichment returned {len(by_index)}/{len(items)} listings, falling back to per-result calls.")
+    except Exception as e:
+        print(f"Gemini batch enrichment failed: {e}")
+    return list(await asyncio.gather(*(enrich_separately_async(item) for item in items)))
+
+async def enrich_items_async(items: List[Dict[str, Any]]) -> List[tuple]:
+    """(summary, price_data, complete) for each item, using the configured ENRICHMENT_MODE."""
+    if ENRICHMENT_MODE == "batched":
+        return await enrich_batch_with_gemini_async(items)
+    return list(await asyncio.gather(*(enrich_separately_async(item) for item in items)))
+
+# --- NEW, EXPANDED, AND WORLDWIDE QUERIES LIST ---
+QUERIES = [
+    # == HotelReservation ==
+    # Middle East
+    ("HotelReservation", "luxury 5-star hotels", "Riyadh"),
+    ("HotelReservation", "Jeddah corniche hotels with sea view", "Jeddah"),
+    ("HotelReservation", "AlUla desert resorts deals", "AlUla, Saudi Arabia"),
+    ("HotelReservation", "luxury hotels near Burj Khalifa", "Dubai"),
+    # Europe
+    ("HotelReservation", "luxury hotels with Eiffel Tower view", "Paris"),
+    ("HotelReservation", "boutique hotels in central", "London"),
+    ("HotelReservation", "hotels near the Colosseum", "Rome"),
+    ("HotelReservation", "canal view hotels", "Amsterdam"),
+    # North America
+    ("HotelReservation", "5-star hotels in Times Square", "New York"),
+    ("HotelReservation", "luxury hotels on the Strip", "Las Vegas"),
+    ("HotelReservation", "all-inclusive beach resorts", "Cancun, Mexico"),
+    # Asia & Oceania
+    ("HotelReservation", "budget hotel deals near Shibuya Crossing", "Tokyo"),
+    ("HotelReservation", "hotels with rooftop pool", "Singapore"),
+    ("HotelReservation", "beach villas", "Maldives"),
+    ("HotelReservation", "hotels with Sydney Opera House view", "Sydney"),
+
+    # == RestaurantBooking ==
+    # Middle East & Europe
+    ("RestaurantBooking", "fine dining restaurants", "Riyadh"),
+    ("RestaurantBooking", "celebrity chef restaurants", "Dubai"),
+    ("RestaurantBooking", "michelin star restaurants", "London"),
+    ("RestaurantBooking", "best pasta restaurants", "Rome, Italy"),
+    # North America & Asia
+    ("RestaurantBooking", "omakase sushi experience", "Tokyo"),
+    ("RestaurantBooking", "rooftop restaurants with city view", "Bangkok"),
+    ("RestaurantBooking", "best steakhouse", "New York"),
+
+    # == SpaBooking ==
+    ("SpaBooking", "luxury spa packages for women", "Riyadh"),
+    ("SpaBooking", "luxury spa and wellness retreats", "Bali, Indonesia"),
+    ("SpaBooking", "day spa packages", "New York"),
+    ("SpaBooking", "thermal baths and spa", "Budapest, Hungary"),
+
+    # == ConcertTicketsBooking ==
+    ("ConcertTicketsBooking", "Riyadh Season event tickets", "Riyadh"),
+    ("ConcertTicketsBooking", "upcoming concerts and music festivals", "Los Angeles"),
+    ("ConcertTicketsBooking", "tickets for broadway shows", "New York"),
+    ("ConcertTicketsBooking", "concerts at the O2 Arena", "London"),
+    ("ConcertTicketsBooking", "K-pop concerts", "Seoul"),
+
+    # == BirthdayBooking ==
+    ("BirthdayBooking", "private yacht party rental", "Miami"),
+    ("BirthdayBooking", "rooftop birthday party venue", "Sydney"),
+    ("BirthdayBooking", "desert safari private dinner", "Dubai"),
+    ("BirthdayBooking", "castle rental for events", "Scotland, UK"),
+
+    # == FlightBooking ==
+    ("FlightBooking", "Saudia business class deals from Riyadh to London", "Saudi Arabia"),
+    ("FlightBooking", "Emirates first class deals from Dubai to New York", "UAE"),
+    ("FlightBooking", "British Airways cheap flights from London to New York", "UK"),
+    ("FlightBooking", "Qantas flights from Sydney to Los Angeles", "Australia"),
+    ("FlightBooking", "Singapore Airlines suites from Singapore to Tokyo", "Singapore")
+]
+
+refresh_scheduler = RefreshScheduler(QUERIES, POLL_INTERVAL_SECONDS)
+
+def record_offer_lookup(category: str, location: str, found: bool = True):
+    """
+    Called on every get_available_offers lookup. Hits raise the priority of the queries
+    serving them; misses are counted so popular ones can be prefetched (see promote_misses).
+    """
+    OFFER_LOOKUPS.inc(result="hit" if found else "miss")
+    # Queued for the refresher, which may be another worker (see apply_demand).
+    key = (category, location)
+    with _pending_demand_lock:
+        demand, misses = _pending_demand.get(key, (0.0, 0.0))
+        _pending_demand[key] = (demand + 1.0, misses + (0.0 if found else 1.0))
+
+def apply_demand(counts: Dict[tuple, tuple]):
+    for (category, location), (demand, misses) in counts.items():
+        refresh_scheduler.record_demand(category, location, demand)
+        if misses:
+            refresh_scheduler.record_miss(category, location, misses)
 
 async def fetch_offers_for_async(agent_name: str, search_term: str, location: str, max_results: int = 2) -> List[Dict[str, Any]]: # Reduced to 2 for more diversity
     q = f'"{search_term}" in {location}'
     try:
         loop = asyncio.get_running_loop()
-        resp = await loop.run_in_executor(
-            None, 
-            lambda: tavily.search(q, search_depth="advanced", include_raw_content=True, max_results=max_results, include_images=True)
-        )
+        resp = await tavily_limiter.call(lambda: loop.run_in_executor(
+            _search_executor,
+            lambda: providers.offer_search_client().search(q, search_depth="advanced", include_raw_content=True, max_results=max_results, include_images=True)
+        ))
         results = resp.get("results", [])
         top_level_images = resp.get("images", [])
         if results and top_level_images:
@@ -102,152 +375,233 @@ async def fetch_offers_for_async(agent_name: str, search_term: str, location: st
         item['original_location'] = location
     return results
 
-async def update_loop():
-    load_cache()
-    # --- NEW, EXPANDED, AND WORLDWIDE QUERIES LIST ---
-    queries = [
-        # == HotelReservation ==
-        # Middle East
-        ("HotelReservation", "luxury 5-star hotels", "Riyadh"),
-        ("HotelReservation", "Jeddah corniche hotels with sea view", "Jeddah"),
-        ("HotelReservation", "AlUla desert resorts deals", "AlUla, Saudi Arabia"),
-        ("HotelReservation", "luxury hotels near Burj Khalifa", "Dubai"),
-        # Europe
-        ("HotelReservation", "luxury hotels with Eiffel Tower view", "Paris"),
-        ("HotelReservation", "boutique hotels in central", "London"),
-        ("HotelReservation", "hotels near the Colosseum", "Rome"),
-        ("HotelReservation", "canal view hotels", "Amsterdam"),
-        # North America
-        ("HotelReservation", "5-star hotels in Times Square", "New York"),
-        ("HotelReservation", "luxury hotels on the Strip", "Las Vegas"),
-        ("HotelReservation", "all-inclusive beach resorts", "Cancun, Mexico"),
-        # Asia & Oceania
-        ("HotelReservation", "budget hotel deals near Shibuya Crossing", "Tokyo"),
-        ("HotelReservation", "hotels with rooftop pool", "Singapore"),
-        ("HotelReservation", "beach villas", "Maldives"),
-        ("HotelReservation", "hotels with Sydney Opera House view", "Sydney"),
-
-        # == RestaurantBooking ==
-        # Middle East & Europe
-        ("RestaurantBooking", "fine dining restaurants", "Riyadh"),
-        ("RestaurantBooking", "celebrity chef restaurants", "Dubai"),
-        ("RestaurantBooking", "michelin star restaurants", "London"),
-        ("RestaurantBooking", "best pasta restaurants", "Rome, Italy"),
-        # North America & Asia
-        ("RestaurantBooking", "omakase sushi experience", "Tokyo"),
-        ("RestaurantBooking", "rooftop restaurants with city view", "Bangkok"),
-        ("RestaurantBooking", "best steakhouse", "New York"),
-        
-        # == SpaBooking ==
-        ("SpaBooking", "luxury spa packages for women", "Riyadh"),
-        ("SpaBooking", "luxury spa and wellness retreats", "Bali, Indonesia"),
-        ("SpaBooking", "day spa packages", "New York"),
-        ("SpaBooking", "thermal baths and spa", "Budapest, Hungary"),
-
-        # == ConcertTicketsBooking ==
-        ("ConcertTicketsBooking", "Riyadh Season event tickets", "Riyadh"),
-        ("ConcertTicketsBooking", "upcoming concerts and music festivals", "Los Angeles"),
-        ("ConcertTicketsBooking", "tickets for broadway shows", "New York"),
-        ("ConcertTicketsBooking", "concerts at the O2 Arena", "London"),
-        ("ConcertTicketsBooking", "K-pop concerts", "Seoul"),
-
-        # == BirthdayBooking ==
-        ("BirthdayBooking", "private yacht party rental", "Miami"),
-        ("BirthdayBooking", "rooftop birthday party venue", "Sydney"),
-        ("BirthdayBooking", "desert safari private dinner", "Dubai"),
-        ("BirthdayBooking", "castle rental for events", "Scotland, UK"),
-
-        # == FlightBooking ==
-        ("FlightBooking", "Saudia business class deals from Riyadh to London", "Saudi Arabia"),
-        ("FlightBooking", "Emirates first class deals from Dubai to New York", "UAE"),
-        ("FlightBooking", "British Airways cheap flights from London to New York", "UK"),
-        ("FlightBooking", "Qantas flights from Sydney to Los Angeles", "Australia"),
-        ("FlightBooking", "Singapore Airlines suites from Singapore to Tokyo", "Singapore")
-    ]
+def build_offer(item: Dict[str, Any], summary: str, price_data: dict) -> Optional[Dict[str, Any]]:
+    """Validates the extracted prices for one raw result. Returns the offer, or None if it has no usable price."""
+    original_price = price_data.get("original_price")
+    offer_price = price_data.get("offer_price")
+    currency = price_data.get("currency")
+
+    if (not isinstance(offer_price, (int, float)) or offer_price <= 0 or 
+        not isinstance(currency, str) or len(currency) != 3):
+        original_price, offer_price, currency = None, None, None
     
-    while True:
-        print("\n--- Starting concurrent offer fetch cycle ---")
-        start_time = time.time()
+    if offer_price and offer_price > 1_000_000:
+        original_price, offer_price, currency = None, None, None
 
-        fetch_tasks = [fetch_offers_for_async(agent, term, loc) for agent, term, loc in queries]
-        list_of_results_lists = await asyncio.gather(*fetch_tasks)
-        all_raw_results = [item for sublist in list_of_results_lists for item in sublist]
-        print(f"Fetched {len(all_raw_results)} raw results from Tavily.")
+    if not isinstance(original_price, (int, float)) or original_price <= 0:
+        original_price = None
 
-        if not all_raw_results:
-            print("--- No raw results found. Ending cycle early. ---")
-            await asyncio.sleep(POLL_INTERVAL_SECONDS)
-            continue
+    if original_price and offer_price and original_price < offer_price:
+        original_price = None
+    
+    if offer_price is None:
+        return None
+    return {
+        "id": item.get("url"), "title": item.get("title", ""), "summary": summary,
+        "url": item.get("url"), "image_url": item.get("image_url", None), "category": item['category'],
+        "location": item['original_location'], 
+        "price": original_price,
+        "offer_price": offer_price,
+        "currency": currency, 
+        "source": "tavily", "fetched_at": int(time.time()),
+    }
+
+async def run_fetch_cycle(queries: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    One refresh pass as a streaming pipeline: search -> dedupe -> enrich -> validate.
+    Each search result is deduplicated by URL and handed to enrichment as soon as its
+    search returns (or, in batched mode, as soon as a batch fills up), so no stage waits
+    for the whole batch. Provider limiters bound the actual request rate; the returned
+    offers keep query order.
+    """
+    seen_urls = set()
+    enrich_tasks = []
+    pending = []
+    batch_size = ENRICH_BATCH_SIZE if ENRICHMENT_MODE == "batched" else 1
+    validated = []
+    stats = {"raw": 0, "enriched": 0, "cached": 0}
+
+    def validate(position: tuple, item: Dict[str, Any], summary: str, price_data: dict):
+        offer = build_offer(item, summary, price_data)
+        if offer:
+            validated.append((position, offer))
+
+    async def enrich_and_validate(chunk: List[tuple]):
+        enriched = await enrich_items_async([item for _, item in chunk])
+        stats["enriched"] += len(chunk)
+        for (position, item), (summary, price_data, complete) in zip(chunk, enriched):
+            # Results of failed calls are retried next cycle rather than cached.
+            if complete:
+                enrichment_cache.put(item, summary, price_data)
+            validate(position, item, summary, price_data)
+
+    def flush():
+        if pending:
+            enrich_tasks.append(asyncio.create_task(enrich_and_validate(pending[:])))
+            pending.clear()
+
+    async def search_and_dispatch(query_index: int, agent: str, term: str, loc: str):
+        results = await fetch_offers_for_async(agent, term, loc)
+        stats["raw"] += len(results)
+        for result_index, item in enumerate(results):
+            url = item.get("url")
+            if not url or url in seen_urls:
+                continue
+            seen_urls.add(url)
+            cached = enrichment_cache.get(item)
+            if cached is not None:
+                stats["cached"] += 1
+                validate((query_index, result_index), item, *cached)
+                continue
+            pending.append(((query_index, result_index), item))
+            if len(pending) >= batch_size:
+                flush()
+
+    await asyncio.gather(*(search_and_dispatch(i, *q) for i, q in enumerate(queries)))
+    flush()
+    await asyncio.gather(*enrich_tasks)
+    print(f"Fetched {stats['raw']} raw results from Tavily, enriched {stats['enriched']} unique pages with Gemini, {stats['cached']} served from the enrichment cache.")
+    return [offer for _, offer in sorted(validated, key=lambda pair: pair[0])]
 
-        summary_tasks = [summarize_with_gemini_async(item.get("content", "")) for item in all_raw_results]
-        price_tasks = [extract_prices_with_gemini_async(item.get("raw_content", item.get("content", ""))) for item in all_raw_results]
-
-        all_gathered_results = await asyncio.gather(*summary_tasks, *price_tasks)
-        num_results = len(all_raw_results)
-        summaries = all_gathered_results[:num_results]
-        prices = all_gathered_results[num_results:]
-        
-        print(f"Generated {len(summaries)} summaries from Gemini.")
-        print(f"Extracted {len(prices)} price data points from Gemini.")
-
-        new_offers = []
-        for i, item in enumerate(all_raw_results):
-            if item.get("url") and not any(existing["id"] == item["url"] for existing in new_offers):
-                image_url = item.get("image_url", None)
-                price_data = prices[i]
-
-                original_price = price_data.get("original_price")
-                offer_price = price_data.get("offer_price")
-                currency = price_data.get("currency")
-
-                if (not isinstance(offer_price, (int, float)) or offer_price <= 0 or 
-                    not isinstance(currency, str) or len(currency) != 3):
-                    original_price, offer_price, currency = None, None, None
-                
-                if offer_price and offer_price > 1_000_000:
-                    original_price, offer_price, currency = None, None, None
-
-                if not isinstance(original_price, (int, float)) or original_price <= 0:
-                    original_price = None
-
-                if original_price and offer_price and original_price < offer_price:
-                    original_price = None
-                
-                if offer_price is not None:
-                    new_offers.append({
-                        "id": item.get("url"), "title": item.get("title", ""), "summary": summaries[i],
-                        "url": item.get("url"), "image_url": image_url, "category": item['category'],
-                        "location": item['original_location'], 
-                        "price": original_price,
-                        "offer_price": offer_price,
-                        "currency": currency, 
-                        "source": "tavily", "fetched_at": int(time.time()),
-                    })
-
-        if new_offers:
-            global _offers
-            _offers = new_offers
-            save_cache()
-            print(f"--- Cycle complete. Filtered down to and saved {len(_offers)} high-quality offers. ---")
-        else:
-            print("--- Cycle complete. No new offers with valid prices were found. ---")
-        
-        end_time = time.time()
-        print(f"--- Offer fetch cycle took {end_time - start_time:.2f} seconds. ---")
-        
-        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+async def refresh_queries(due: List[ScheduledQuery]) -> int:
+    """
+    One refresh cycle: fetches the given queries, upserts the results by URL and publishes
+    the new snapshot. Returns offers upserted. Must run in the worker holding the refresher lease.
+    """
+    print(f"\n--- Refreshing {len(due)} due offer queries ---")
+    start_time = time.time()
+
+    new_offers = await run_fetch_cycle([q.key for q in due])
+    refresh_scheduler.mark_refreshed(due)
+    await asyncio.to_thread(enrichment_cache.save)
+
+    offers = merge_offers(catalog.offers, new_offers, OFFER_MAX_AGE_SECONDS)
+    await asyncio.to_thread(publish_offers, offers)
+
+    end_time = time.time()
+    REFRESH_CYCLE_SECONDS.observe(end_time - start_time)
+    print(f"--- Refresh took {end_time - start_time:.2f} seconds: {len(new_offers)} offers upserted, {len(offers)} in catalog. ---")
+    return len(new_offers)
+
+async def become_refresher():
+    """Runs when this worker takes the refresher lease: picks up where the previous refresher left off."""
+    await asyncio.to_thread(sync_catalog)
+    if not catalog.version:
+        legacy = load_legacy_cache()
+        if legacy and await asyncio.to_thread(publish_offers, legacy):
+            print(f"--- Imported {len(legacy)} offers from {CACHE_FILE} into the offer store ---")
+    await asyncio.to_thread(enrichment_cache.load)
+    refresh_scheduler.seed_from_offers(catalog.offers)
+    print(f"--- Worker {WORKER_ID} is now the offer refresher ---")
+
+async def refresher_tick() -> float:
+    """One scheduler tick in the refresher. Returns seconds until the next tick."""
+    apply_demand(take_pending_demand())
+    apply_demand(await asyncio.to_thread(offer_store.take_demand))
+    refresh_scheduler.decay()
+    for query in refresh_scheduler.promote_misses(MISS_PROMOTION_THRESHOLD, MAX_PROMOTED_QUERIES):
+        print(f"--- Prefetching frequently missed offers: {query.category} in {query.location} ---")
+    due = refresh_scheduler.due(REFRESH_BATCH_SIZE)
+    if due:
+        await refresh_queries(due)
+    # Wake up in time to renew the lease.
+    return max(1.0, min(SCHEDULER_TICK_SECONDS, REFRESHER_LEASE_SECONDS / 3, refresh_scheduler.seconds_until_next_due()))
+
+async def update_loop():
+    """
+    Every worker runs this loop, but only the one holding the refresher lease refreshes:
+    each tick it takes the highest-priority due queries, fetches them and publishes the
+    result to the shared offer store. The others forward their lookups to the store and
+    load each new snapshot as it appears.
+    """
+    global _is_refresher
+    while True:
+        delay = OFFER_STORE_POLL_SECONDS
+        try:
+            leader = await asyncio.to_thread(offer_store.try_acquire_lease, WORKER_ID, REFRESHER_LEASE_SECONDS)
+            if leader and not _is_refresher:
+                await become_refresher()
+            elif _is_refresher and not leader:
+                print(f"--- Worker {WORKER_ID} is no longer the offer refresher ---")
+            _is_refresher = leader
+            if leader:
+                delay = await refresher_tick()
+            else:
+                await asyncio.to_thread(offer_store.add_demand, take_pending_demand())
+                await asyncio.to_thread(sync_catalog)
+        except Exception as e:
+            print(f"Offer update loop error: {e}")
+        await asyncio.sleep(delay)
 
 @app.on_event("startup")
 async def startup_event():
-    load_cache()
-    loop = asyncio.get_event_loop()
-    loop.create_task(update_loop())
-    print("Offer service background task started. Initial offers loaded:", len(_offers))
+    global _update_task
+    await asyncio.to_thread(offer_store.init)
+    await asyncio.to_thread(sync_catalog)
+    _update_task = asyncio.get_running_loop().create_task(update_loop())
+    print(f"Offer service background task started in worker {WORKER_ID}. Initial offers loaded:", len(catalog))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global _is_refresher
+    if _update_task is not None:
+        _update_task.cancel()
+    if _is_refresher:
+        # Lets another worker take over right away instead of waiting for the lease to expire.
+        await asyncio.to_thread(offer_store.release_lease, WORKER_ID)
+        _is_refresher = False
 
 @app.get("/offers")
-async def get_offers():
-    return JSONResponse(content={"offers": _offers})
+async def get_offers(
+    request: Request,
+    category: Optional[str] = None,
+    location: Optional[str] = None,
+    currency: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    """
+    Offers matching the filters, in catalog order. Without `limit` every match is returned;
+    with it, the cursor for the next page comes back in the `X-Next-Cursor` header.
+    Bodies are cached per catalog version and served gzip/brotli-encoded when accepted;
+    polling with If-None-Match returns 304 until the catalog changes.
+    """
+    try:
+        offset = int(cursor) if cursor else 0
+        if offset < 0:
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    key = (category or None, (location or "").strip().lower() or None, (currency or "").upper() or None,
+           min_price, max_price, offset, limit)
+
+    etag = make_etag(catalog.version, key)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"})
+
+    def build():
+        # The body is labelled with the version select() read, which is newer than the one
+        # above if a refresh landed in between.
+        version, docs = catalog.select(category, location, currency, min_price, max_price)
+        page = docs[offset:offset + limit] if limit else docs[offset:]
+        headers = {}
+        if limit and offset + limit < len(docs):
+            headers["X-Next-Cursor"] = str(offset + limit)
+        return version, ('{"offers":[' + ",".join(page) + "]}").encode("utf-8"), headers
+
+    accepted = negotiate_encoding(request.headers.get("accept-encoding"))
+    version, body, encoding, extra_headers = offers_payloads.get(catalog.version, key, build, accepted)
+    headers = {"ETag": make_etag(version, key), "Cache-Control": "no-cache", "Vary": "Accept-Encoding", **extra_headers}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.get("/health")
 async def health():
-    return {"ok": True, "offers": len(_offers)}
\ No newline at end of file
+    return {
+        "ok": True, "offers": len(catalog), "catalog_version": catalog.version, "refresher": _is_refresher,
+        "enrichment_cache": enrichment_cache.stats(),
+        "refresh_queries": len(refresh_scheduler), "promoted_queries": refresh_scheduler.promoted,
+    }
\ No newline at end of file
@@ -0,0 +1,183 @@
+import time
+from typing import Collection, Dict, List, Optional, Tuple
+
+import database
+
+LEASE_NAME = "offer_refresher"
+
+class OfferStore:
+    """
+    Offer snapshots shared by every worker, kept in the application database (the
+    SQLite file by default, Postgres when DATABASE_URL is set).
+
+    Exactly one worker at a time holds the refresher lease and publishes new snapshots;
+    publishing is fenced by the lease, so a worker that lost it cannot overwrite a newer
+    snapshot. The other workers poll `version()` (one indexed read) and load a snapshot
+    only when it changed, and then only the categories whose fingerprint changed. Lookups recorded by any worker are queued in the store and
+    applied by the refresher.
+    """
+
+    def __init__(self, backend=None, keep_versions: int = 2):
+        self.backend = backend or database.backend
+        self.keep_versions = keep_versions
+
+    def init(self):
+        b = self.backend
+        b.execute("""
+            CREATE TABLE IF NOT EXISTS offer_snapshots (
+                version INTEGER PRIMARY KEY,
+                published_at REAL NOT NULL,
+                owner TEXT NOT NULL,
+                offer_count INTEGER NOT NULL
+            )
+        """)
+        # One segment per category, in catalog order, fingerprinted so readers can skip
+        # the categories they already hold.
+        b.execute("""
+            CREATE TABLE IF NOT EXISTS offer_segments (
+                version INTEGER NOT NULL,
+                segment INTEGER NOT NULL,
+                category TEXT,
+                fingerprint TEXT NOT NULL,
+                offer_count INTEGER NOT NULL,
+                PRIMARY KEY (version, segment)
+            )
+        """)
+        # One compact JSON document per offer, in segment order.
+        b.execute("""
+            CREATE TABLE IF NOT EXISTS offer_segment_rows (
+                version INTEGER NOT NULL,
+                segment INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (version, segment, position)
+            )
+        """)
+        # Snapshots stored before segments can't be loaded; the refresher republishes.
+        b.execute("DROP TABLE IF EXISTS offer_rows")
+        b.execute("DELETE FROM offer_snapshots WHERE version NOT IN (SELECT version FROM offer_segments)")
+        b.execute("""
+            CREATE TABLE IF NOT EXISTS offer_refresher_lease (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        b.execute("""
+            CREATE TABLE IF NOT EXISTS offer_demand (
+                category TEXT NOT NULL,
+                location TEXT NOT NULL,
+                demand REAL NOT NULL,
+                misses REAL NOT NULL,
+                PRIMARY KEY (category, location)
+            )
+        """)
+
+    # --- Refresher lease ---
+
+    def try_acquire_lease(self, owner: str, ttl_seconds: float) -> bool:
+        """Takes or renews the refresher lease; True if `owner` holds it for the next `ttl_seconds`."""
+        now = time.time()
+        return self.backend.execute("""
+            INSERT INTO offer_refresher_lease (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE offer_refresher_lease.owner = excluded.owner OR offer_refresher_lease.expires_at < ?
+        """, (LEASE_NAME, owner, now + ttl_seconds, now)) > 0
+
+    def release_lease(self, owner: str):
+        self.backend.execute("DELETE FROM offer_refresher_lease WHERE name = ? AND owner = ?", (LEASE_NAME, owner))
+
+    # --- Snapshots ---
+
+    def version(self) -> int:
+        """The latest published version; 0 if nothing was published yet."""
+        row = self.backend.fetchone("SELECT COALESCE(MAX(version), 0) FROM offer_snapshots")
+        return row[0]
+
+    def publish(self, segments: List[Tuple[Optional[str], str, List[str]]], owner: str) -> Optional[int]:
+        """
+        Publishes pre-serialized offers, as (category, fingerprint, payloads) per category, as
+        the next version if `owner` still holds the lease. Returns the new version, or None if
+        the lease was lost.
+        """
+        b = self.backend
+        with b.connection("offer_publish") as conn:
+            cursor = conn.cursor()
+            cursor.execute(b._sql("SELECT owner, expires_at FROM offer_refresher_lease WHERE name = ?"), (LEASE_NAME,))
+            lease = cursor.fetchone()
+            if lease is None or lease[0] != owner or lease[1] < time.time():
+                return None
+            cursor.execute(b._sql("SELECT COALESCE(MAX(version), 0) FROM offer_snapshots"))
+            version = cursor.fetchone()[0] + 1
+            cursor.executemany(
+                b._sql("INSERT INTO offer_segments (version, segment, category, fingerprint, offer_count) VALUES (?, ?, ?, ?, ?)"),
+                [(version, s, category, fingerprint, len(payloads)) for s, (category, fingerprint, payloads) in enumerate(segments)]
+            )
+            cursor.executemany(
+                b._sql("INSERT INTO offer_segment_rows (version, segment, position, payload) VALUES (?, ?, ?, ?)"),
+                [(version, s, i, payload) for s, (_, _, payloads) in enumerate(segments) for i, payload in enumerate(payloads)]
+            )
+            cursor.execute(
+                b._sql("INSERT INTO offer_snapshots (version, published_at, owner, offer_count) VALUES (?, ?, ?, ?)"),
+                (version, time.time(), owner, sum(len(payloads) for _, _, payloads in segments))
+            )
+            # Older versions are kept briefly so a reader that just saw them can finish loading.
+            oldest_kept = version - self.keep_versions + 1
+            cursor.execute(b._sql("DELETE FROM offer_segment_rows WHERE version < ?"), (oldest_kept,))
+            cursor.execute(b._sql("DELETE FROM offer_segments WHERE version < ?"), (oldest_kept,))
+            cursor.execute(b._sql("DELETE FROM offer_snapshots WHERE version < ?"), (oldest_kept,))
+        return version
+
+    def load(self, version: Optional[int] = None, have: Collection[str] = ()
+             ) -> Tuple[int, List[Tuple[Optional[str], str, Optional[List[str]]]]]:
+        """
+        (version, [(category, fingerprint, payloads), ...]) of the given or latest snapshot, in
+        catalog order; (0, []) if there is none. Payloads of segments whose fingerprint is in
+        `have` are not read and come back as None.
+        """
+        b = self.backend
+        for _ in range(3):
+            target = version or self.version()
+            if not target:
+                return 0, []
+            row = b.fetchone("SELECT offer_count FROM offer_snapshots WHERE version = ?", (target,))
+            segments = b.fetchall(
+                "SELECT segment, category, fingerprint, offer_count FROM offer_segments WHERE version = ? ORDER BY segment",
+                (target,))
+            wanted = [s["segment"] for s in segments if s["fingerprint"] not in have]
+            payloads: Dict[int, List[str]] = {s: [] for s in wanted}
+            if wanted:
+                rows = b.fetchall(
+                    f"SELECT segment, payload FROM offer_segment_rows WHERE version = ? "
+                    f"AND segment IN ({', '.join('?' * len(wanted))}) ORDER BY segment, position",
+                    (target, *wanted))
+                for r in rows:
+                    payloads[r["segment"]].append(r["payload"])
+            if (row is not None and sum(s["offer_count"] for s in segments) == row[0]
+                    and all(len(payloads[s["segment"]]) == s["offer_count"] for s in segments if s["segment"] in payloads)):
+                return target, [(s["category"], s["fingerprint"], payloads.get(s["segment"])) for s in segments]
+            # Pruned by newer publishes while we were reading; retry with the latest.
+            version = None
+        raise RuntimeError("Offer snapshot kept changing while loading.")
+
+    # --- Demand from lookups in any worker ---
+
+    def add_demand(self, counts: Dict[Tuple[str, str], Tuple[float, float]]):
+        """Queues (demand, misses) per (category, location) for the refresher."""
+        if not counts:
+            return
+        b = self.backend
+        with b.connection("offer_add_demand") as conn:
+            conn.cursor().executemany(b._sql("""
+                INSERT INTO offer_demand (category, location, demand, misses) VALUES (?, ?, ?, ?)
+                ON CONFLICT (category, location) DO UPDATE SET
+                    demand = offer_demand.demand + excluded.demand, misses = offer_demand.misses + excluded.misses
+            """), [(category, location, demand, misses) for (category, location), (demand, misses) in counts.items()])
+
+    def take_demand(self) -> Dict[Tuple[str, str], Tuple[float, float]]:
+        """Removes and returns everything queued by add_demand."""
+        with self.backend.connection("offer_take_demand") as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM offer_demand RETURNING category, location, demand, misses")
+            rows = cursor.fetchall()
+        return {(category, location): (demand, misses) for category, location, demand, misses in rows}
@@ -0,0 +1,97 @@
+"""
+Factories for the external providers (Gemini chat and embeddings, Tavily, page fetches, Chromium).
+PROVIDER_MODE=fake swaps every one of them for the deterministic offline fakes in
+`fakes.py`, so the app and the benchmarks run without network access or API keys.
+
+Provider SDKs are imported inside the factories, and the shared clients below are built
+on first use, so importing the app stays cheap and every module reuses one client.
+"""
+import os
+import functools
+import threading
+
+def use_fakes() -> bool:
+    # Read on every call so a PROVIDER_MODE loaded later from .env still applies.
+    return os.getenv("PROVIDER_MODE", "live") == "fake"
+
+def require_keys(*names: str):
+    """Raises if a live provider's API key is missing; fakes need none."""
+    if use_fakes():
+        return
+    missing = [name for name in names if not os.getenv(name)]
+    if missing:
+        raise RuntimeError(f"Please set {' and '.join(missing)} in .env")
+
+def create_chat_model(model: str = "gemini-2.5-flash-lite", temperature: float = 0.0, **kwargs):
+    if use_fakes():
+        from fakes import FakeChatModel, faults_from_env
+        return FakeChatModel(faults=faults_from_env("FAKE_LLM", 0.05), **kwargs)
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature, **kwargs)
+
+def create_embeddings(model: str = "models/gemini-embedding-001"):
+    if use_fakes():
+        from fakes import FakeEmbeddings, faults_from_env
+        return FakeEmbeddings(faults=faults_from_env("FAKE_EMBED", 0.005))
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=model, google_api_key=os.getenv("GOOGLE_API_KEY"))
+
+def create_offer_search_client():
+    """Blocking Tavily client used by the offer service's refresh cycle."""
+    if use_fakes():
+        from fakes import FakeTavilyClient, faults_from_env
+        return FakeTavilyClient(faults=faults_from_env("FAKE_SEARCH", 0.1))
+    from tavily import TavilyClient
+    return TavilyClient(api_key=os.getenv("TAVILY_API_KEY", ""))
+
+def create_web_search_backend():
+    """Backend for the agents' web_search_tool."""
+    if use_fakes():
+        from fakes import FakeSearchBackend, faults_from_env
+        return FakeSearchBackend(faults=faults_from_env("FAKE_SEARCH", 0.1))
+    from search_cache import TavilySearchBackend
+    return TavilySearchBackend(max_results=4)
+
+def create_image_extractor():
+    """Callable (url, limit) -> image URLs from a plain HTTP fetch of the page, no browser."""
+    if use_fakes():
+        from fakes import FakeImageExtractor, faults_from_env
+        return FakeImageExtractor(faults=faults_from_env("FAKE_FETCH", 0.05))
+    from image_extractor import extract_images
+    return extract_images
+
+def create_browser_pool(**kwargs):
+    if use_fakes():
+        from fakes import FakeBrowserPool, faults_from_env
+        return FakeBrowserPool(faults=faults_from_env("FAKE_BROWSER", 0.2))
+    from browser_pool import BrowserPool
+    return BrowserPool(**kwargs)
+
+def singleton(factory):
+    """Memoizes a zero-argument factory: built on the first call (thread-safe), shared afterwards."""
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    get.reset = instance.clear
+    return get
+
+@singleton
+def chat_model():
+    """The Gemini chat client shared by the agents, the context summarizer and offer enrichment."""
+    return create_chat_model()
+
+@singleton
+def embeddings():
+    return create_embeddings()
+
+@singleton
+def offer_search_client():
+    return create_offer_search_client()
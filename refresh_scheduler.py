@@ -0,0 +1,174 @@
+import time
+import math
+import heapq
+from typing import List, Dict, Any, Optional, Tuple
+
+# Relative refresh intervals per category, as multiples of the base poll interval.
+# Prices for flights and event tickets move fastest; venues for birthdays hardly change.
+CATEGORY_INTERVAL_FACTORS = {
+    "FlightBooking": 0.5,
+    "ConcertTicketsBooking": 0.5,
+    "HotelReservation": 1.0,
+    "RestaurantBooking": 2.0,
+    "SpaBooking": 2.0,
+    "BirthdayBooking": 6.0,
+}
+
+# Search terms used when a frequently missed (category, location) pair is promoted into the refresh set.
+PROMOTED_SEARCH_TERMS = {
+    "FlightBooking": "flight deals",
+    "ConcertTicketsBooking": "concert and event tickets",
+    "HotelReservation": "hotel deals",
+    "RestaurantBooking": "best restaurants",
+    "SpaBooking": "spa packages",
+    "BirthdayBooking": "birthday party venues",
+}
+
+class ScheduledQuery:
+    """One (category, search term, location) query and its refresh bookkeeping."""
+
+    def __init__(self, category: str, term: str, location: str, interval: float):
+        self.category = category
+        self.term = term
+        self.location = location
+        self.interval = interval
+        self.last_refreshed = 0.0
+        self.demand = 0.0
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return (self.category, self.term, self.location)
+
+    def staleness(self, now: float) -> float:
+        """Age relative to the refresh interval; >= 1.0 means the query is due."""
+        return (now - self.last_refreshed) / self.interval
+
+    def priority(self, now: float) -> float:
+        return self.staleness(now) * (1.0 + math.log1p(self.demand))
+
+class RefreshScheduler:
+    """
+    Decides which offer queries to refresh next. Each query has its own interval;
+    among due queries, the stalest and most requested go first.
+    Lookups that missed the catalog are counted per (category, location); pairs missed
+    often enough are promoted into the refresh set and demoted again once demand fades.
+    Demand and miss counts decay with a half-life of `demand_half_life` seconds.
+    """
+
+    def __init__(self, queries: List[tuple], base_interval: float, interval_factors: Dict[str, float] = None,
+                 demand_half_life: float = None):
+        self.base_interval = base_interval
+        self.interval_factors = interval_factors or CATEGORY_INTERVAL_FACTORS
+        self.demand_half_life = demand_half_life or base_interval
+        self._queries: Dict[Tuple[str, str, str], ScheduledQuery] = {}
+        self._misses: Dict[Tuple[str, str], float] = {}
+        self._promoted: set = set()
+        self._last_decay = time.time()
+        for category, term, location in queries:
+            self.add(category, term, location)
+
+    def interval_for(self, category: str) -> float:
+        return self.base_interval * self.interval_factors.get(category, 1.0)
+
+    def add(self, category: str, term: str, location: str) -> ScheduledQuery:
+        key = (category, term, location)
+        if key not in self._queries:
+            self._queries[key] = ScheduledQuery(category, term, location, self.interval_for(category))
+        return self._queries[key]
+
+    def remove(self, category: str, term: str, location: str):
+        self._queries.pop((category, term, location), None)
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def seed_from_offers(self, offers: List[Dict[str, Any]]):
+        """Treats queries as refreshed at the newest `fetched_at` of the cached offers for their category/location."""
+        newest: Dict[Tuple[str, str], float] = {}
+        for offer in offers:
+            key = (offer.get("category"), offer.get("location"))
+            newest[key] = max(newest.get(key, 0.0), float(offer.get("fetched_at") or 0))
+        for query in self._queries.values():
+            query.last_refreshed = max(query.last_refreshed, newest.get((query.category, query.location), 0.0))
+
+    def record_demand(self, category: str, location: str, weight: float = 1.0):
+        """Bumps the demand of queries serving this category whose location matches the lookup."""
+        location = (location or "").lower()
+        for query in self._queries.values():
+            if query.category == category and location and location in query.location.lower():
+                query.demand += weight
+
+    def record_miss(self, category: str, location: str, weight: float = 1.0):
+        location = " ".join((location or "").split()).lower()
+        if category in PROMOTED_SEARCH_TERMS and location:
+            self._misses[(category, location)] = self._misses.get((category, location), 0.0) + weight
+
+    def decay(self, now: Optional[float] = None, demote_below: float = 0.5):
+        """Applies half-life decay to demand and miss counts; demotes promoted queries nobody asks for anymore."""
+        now = time.time() if now is None else now
+        factor = 0.5 ** ((now - self._last_decay) / self.demand_half_life)
+        self._last_decay = now
+        for query in self._queries.values():
+            query.demand *= factor
+        self._misses = {key: count * factor for key, count in self._misses.items() if count * factor >= demote_below}
+        for key in [k for k in self._promoted if self._queries[k].demand < demote_below]:
+            self._promoted.discard(key)
+            self.remove(*key)
+
+    def promote_misses(self, min_misses: float, max_promoted: int) -> List[ScheduledQuery]:
+        """
+        Adds a refresh query for every (category, location) missed at least `min_misses` times,
+        keeping at most `max_promoted` promoted queries (the least demanded one makes room).
+        """
+        promoted = []
+        for (category, location), count in sorted(self._misses.items(), key=lambda kv: kv[1], reverse=True):
+            if count < min_misses:
+                break
+            key = (category, PROMOTED_SEARCH_TERMS[category], location.title())
+            if key in self._queries:
+                continue
+            if len(self._promoted) >= max_promoted:
+                weakest = min(self._promoted, key=lambda k: self._queries[k].demand)
+                if self._queries[weakest].demand >= count:
+                    break
+                self._promoted.discard(weakest)
+                self.remove(*weakest)
+            query = self.add(*key)
+            query.demand = count
+            self._promoted.add(key)
+            del self._misses[(category, location)]
+            promoted.append(query)
+        return promoted
+
+    @property
+    def promoted(self) -> List[Tuple[str, str, str]]:
+        return sorted(self._promoted)
+
+    def due(self, limit: int, now: Optional[float] = None) -> List[ScheduledQuery]:
+        """Up to `limit` due queries, highest priority first."""
+        now = time.time() if now is None else now
+        candidates = [q for q in self._queries.values() if q.staleness(now) >= 1.0]
+        return heapq.nlargest(limit, candidates, key=lambda q: q.priority(now))
+
+    def mark_refreshed(self, queries: List[ScheduledQuery], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        for query in queries:
+            query.last_refreshed = now
+
+    def seconds_until_next_due(self, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        if not self._queries:
+            return self.base_interval
+        return max(0.0, min(q.last_refreshed + q.interval - now for q in self._queries.values()))
+
+def merge_offers(existing: List[Dict[str, Any]], fresh: List[Dict[str, Any]], max_age_seconds: float,
+                 now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Upserts `fresh` offers into `existing` by URL id and drops offers not refreshed within
+    `max_age_seconds`. A refresh that returns nothing for a query never wipes its offers at once.
+    """
+    now = time.time() if now is None else now
+    merged = {offer["id"]: offer for offer in existing if now - float(offer.get("fetched_at") or 0) <= max_age_seconds}
+    for offer in fresh:
+        merged[offer["id"]] = offer
+    return list(merged.values())
@@ -0,0 +1,115 @@
+import re
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import providers
+import vectorstore
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+
+def normalize_turn(text: str) -> str:
+    """Lowercases and strips punctuation/extra whitespace so trivially different phrasings embed alike."""
+    return " ".join(_PUNCT_RE.sub(" ", (text or "").lower()).split())
+
+class SemanticResponseCache:
+    """
+    Caches final agent responses in a Chroma collection, keyed by agent name and the
+    embedding of the normalized user turn. A lookup hits when the nearest cached turn for
+    the same agent has cosine similarity >= `similarity_threshold`, the entry is younger
+    than `ttl_seconds`, and `freshness(agent_name)` still matches the value recorded when
+    the entry was stored (e.g. the offer catalog version for that agent's category).
+    At most `max_entries` are kept; the least recently used is evicted first. The collection
+    is on disk, so entries surviving a restart are reloaded into the LRU, oldest first.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: int = 3600, max_entries: int = 1000,
+                 freshness: Optional[Callable[[str], str]] = None, collection_name: str = "agent_response_cache"):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.freshness = freshness or (lambda agent_name: "")
+        self.collection = vectorstore.get_client().get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load_existing()
+
+    def _load_existing(self):
+        """Seeds the LRU from stored entries by age; expired ones and any beyond `max_entries` are deleted."""
+        stored = self.collection.get(include=["metadatas"])
+        entries = sorted(zip(stored["ids"], stored["metadatas"]), key=lambda e: (e[1] or {}).get("created_at", 0))
+        cutoff = time.time() - self.ttl_seconds
+        live = [entry_id for entry_id, metadata in entries if (metadata or {}).get("created_at", 0) >= cutoff]
+        kept = live[-self.max_entries:] if self.max_entries > 0 else []
+        kept_ids = set(kept)
+        stale = [entry_id for entry_id, _ in entries if entry_id not in kept_ids]
+        if stale:
+            self.collection.delete(ids=stale)
+        self._lru.update((entry_id, None) for entry_id in kept)
+
+    async def embed(self, text: str) -> list:
+        return await providers.embeddings().aembed_query(normalize_turn(text))
+
+    def lookup(self, agent_name: str, embedding: list) -> Optional[str]:
+        """Returns the cached response for the closest matching turn, or None."""
+        if not self._lru:
+            self.misses += 1
+            return None
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=1,
+            where={"agent_name": agent_name},
+            include=["documents", "metadatas", "distances"],
+        )
+        if results.get("ids") and results["ids"][0]:
+            entry_id = results["ids"][0][0]
+            metadata = results["metadatas"][0][0]
+            similarity = 1.0 - results["distances"][0][0]
+            fresh = (time.time() - metadata["created_at"] <= self.ttl_seconds
+                     and metadata["freshness"] == self.freshness(agent_name))
+            if similarity >= self.similarity_threshold and fresh:
+                with self._lock:
+                    if entry_id in self._lru:
+                        self._lru.move_to_end(entry_id)
+                self.hits += 1
+                return results["documents"][0][0]
+            if not fresh:
+                self._delete(entry_id)
+        self.misses += 1
+        return None
+
+    def store(self, agent_name: str, embedding: list, response: str):
+        entry_id = str(uuid.uuid4())
+        self.collection.add(
+            ids=[entry_id],
+            embeddings=[embedding],
+            documents=[response],
+            metadatas=[{"agent_name": agent_name, "created_at": time.time(), "freshness": self.freshness(agent_name)}],
+        )
+        with self._lock:
+            self._lru[entry_id] = None
+            evicted = [self._lru.popitem(last=False)[0] for _ in range(len(self._lru) - self.max_entries)]
+        if evicted:
+            self.collection.delete(ids=evicted)
+
+    def _delete(self, entry_id: str):
+        with self._lock:
+            self._lru.pop(entry_id, None)
+        self.collection.delete(ids=[entry_id])
+
+    async def alookup(self, agent_name: str, embedding: list) -> Optional[str]:
+        return await asyncio.to_thread(self.lookup, agent_name, embedding)
+
+    async def astore(self, agent_name: str, embedding: list, response: str):
+        await asyncio.to_thread(self.store, agent_name, embedding, response)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._lru), "hits": self.hits, "misses": self.misses}
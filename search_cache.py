@@ -0,0 +1,75 @@
+import time
+import json
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict
+
+def normalize_query(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+class SearchBackend:
+    """Interface for the upstream web search used by `web_search_tool`."""
+
+    async def search(self, query: str) -> Any:
+        raise NotImplementedError
+
+class TavilySearchBackend(SearchBackend):
+    def __init__(self, max_results: int = 4):
+        self.max_results = max_results
+        self._tool = None
+
+    async def search(self, query: str) -> Any:
+        if self._tool is None:
+            # Built on first search so importing the tools doesn't load the Tavily SDK.
+            from langchain_tavily import TavilySearch
+            self._tool = TavilySearch(max_results=self.max_results)
+        return await self._tool.ainvoke({"query": query})
+
+class CachedSearch:
+    """
+    TTL + LRU cache keyed by the normalized query, with single-flight coalescing:
+    concurrent searches for the same query share one upstream call. Errors are not cached.
+    """
+
+    def __init__(self, backend: SearchBackend, ttl_seconds: int = 900, max_entries: int = 512):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def search(self, query: str) -> Any:
+        key = normalize_query(query)
+        entry = self._cache.get(key)
+        if entry is not None and time.time() - entry[0] <= self.ttl_seconds:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            # The upstream call runs as its own task so a cancelled caller doesn't cancel it for the others.
+            task = asyncio.ensure_future(self._fetch(key, query))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, query: str) -> Any:
+        result = await self.backend.search(query)
+        self._cache[key] = (time.time(), result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+def format_results(result: Any) -> str:
+    return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
@@ -0,0 +1,130 @@
+"""
+BrowserPool page management and crash recovery, against in-memory stand-ins for the
+Playwright browser, context and pages (no Chromium needed).
+
+    python -m pytest tests/test_browser_pool.py
+"""
+import asyncio
+
+import pytest
+
+from browser_pool import BrowserPool
+
+class FakePage:
+    def __init__(self, browser):
+        self.browser = browser
+
+    async def goto(self, url, **kwargs):
+        if "slow" in url:
+            await asyncio.sleep(0.2)
+        if not self.browser.connected or "fail" in url:
+            raise RuntimeError("navigation failed")
+
+    async def wait_for_selector(self, *args, **kwargs):
+        pass
+
+    async def eval_on_selector_all(self, *args):
+        return ["https://img.example/a.jpg", "https://img.example/a.jpg", "https://img.example/b.jpg"]
+
+    async def close(self):
+        pass
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+
+    async def route(self, pattern, handler):
+        pass
+
+    async def new_page(self):
+        return FakePage(self.browser)
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.handlers = {}
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def is_connected(self):
+        return self.connected
+
+    def crash(self):
+        self.connected = False
+        self.handlers["disconnected"](self)
+
+    async def new_context(self):
+        return FakeContext(self)
+
+    async def close(self):
+        self.connected = False
+
+class FakePlaywright:
+    async def stop(self):
+        pass
+
+class FakeBrowserPool(BrowserPool):
+    def __init__(self, fail_launches: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_launches = fail_launches
+        self.browsers = []
+
+    async def _launch(self):
+        if self.fail_launches:
+            self.fail_launches -= 1
+            raise RuntimeError("launch failed")
+        self.browsers.append(FakeBrowser())
+        return FakePlaywright(), self.browsers[-1]
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_scrape_dedupes_and_caches():
+    async def scenario():
+        pool = FakeBrowserPool()
+        assert await pool.scrape_images("https://site.example/", limit=10) == ["https://img.example/a.jpg", "https://img.example/b.jpg"]
+        assert await pool.scrape_images("https://site.example/", limit=1) == ["https://img.example/a.jpg"]
+        assert len(pool.browsers) == 1
+    run(scenario())
+
+def test_relaunches_after_disconnect():
+    async def scenario():
+        pool = FakeBrowserPool()
+        await pool.scrape_images("https://site.example/one")
+        pool.browsers[0].crash()
+        assert not pool.started
+        assert await pool.scrape_images("https://site.example/two")
+        assert len(pool.browsers) == 2
+    run(scenario())
+
+def test_resets_when_navigation_finds_browser_gone():
+    async def scenario():
+        pool = FakeBrowserPool()
+        await pool.scrape_images("https://site.example/one")
+        pool.browsers[0].connected = False  # Died without a disconnected event.
+        with pytest.raises(RuntimeError):
+            await pool.scrape_images("https://site.example/two")
+        assert await pool.scrape_images("https://site.example/three")
+        assert len(pool.browsers) == 2
+    run(scenario())
+
+def test_retries_launch_after_failure():
+    async def scenario():
+        pool = FakeBrowserPool(fail_launches=1)
+        with pytest.raises(RuntimeError):
+            await pool.scrape_images("https://site.example/")
+        assert not pool.started
+        assert await pool.scrape_images("https://site.example/")
+    run(scenario())
+
+def test_waiter_gets_replacement_for_dropped_page():
+    async def scenario():
+        pool = FakeBrowserPool(max_pages=1, timeout_ms=1000)
+        failing = asyncio.create_task(pool.scrape_images("https://site.example/slow-fail"))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.create_task(pool.scrape_images("https://site.example/ok"))
+        with pytest.raises(RuntimeError):
+            await failing
+        assert await asyncio.wait_for(waiting, 0.5)
+    run(scenario())
@@ -0,0 +1,66 @@
+"""
+image_extractor against pages served by a local http.server, so no network is needed.
+
+    python -m pytest tests/test_image_extractor.py
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import image_extractor
+
+PAGES = {
+    "/offer.html": """<!doctype html><html><head>
+        <meta property="og:image" content="/img/hero.jpg">
+        <meta property="og:image:width" content="1200">
+        <meta property="og:image:height" content="630">
+        <link rel="icon" href="/favicon.ico">
+        </head><body>
+        <img src="/img/room.jpg" width="800" height="600">
+        <img srcset="/img/pool-480.jpg 480w, /img/pool-1000.jpg 1000w">
+        <img src="/img/logo.png" width="300" height="300">
+        <img src="/img/thumb.jpg" width="50" height="50">
+        <img src="/img/gallery-1.jpg" width="640" height="480">
+        <img src="/img/gallery-2.jpg" width="600" height="400">
+        </body></html>""",
+    # The only image comes after 64 KB of padding.
+    "/long.html": "<html><body>" + "<p>" + "x" * 64 * 1024 + "</p>" + '<img src="/img/late.jpg" width="800" height="600"></body></html>',
+}
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = PAGES.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = HTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def test_ranks_og_image_with_trailing_size_first(base_url):
+    images = image_extractor.extract_images(f"{base_url}/offer.html")
+    assert images[:3] == [f"{base_url}/img/hero.jpg", f"{base_url}/img/pool-1000.jpg", f"{base_url}/img/room.jpg"]
+    assert not any(url.endswith(("logo.png", "thumb.jpg", "favicon.ico", "pool-480.jpg")) for url in images)
+
+def test_respects_limit(base_url):
+    assert len(image_extractor.extract_images(f"{base_url}/offer.html", limit=2)) == 2
+
+def test_stops_reading_at_byte_cap(base_url):
+    assert image_extractor.extract_images(f"{base_url}/long.html", max_bytes=16 * 1024) == []
+    assert image_extractor.extract_images(f"{base_url}/long.html", max_bytes=128 * 1024) == [f"{base_url}/img/late.jpg"]
@@ -0,0 +1,108 @@
+import time
+import random
+import asyncio
+import weakref
+from typing import Awaitable, Callable, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+_limiters: "weakref.WeakSet[ProviderLimiter]" = weakref.WeakSet()
+
+PROVIDER_CALL_SECONDS = metrics.histogram("provider_call_seconds", "Latency of rate-limited provider calls, per attempt.", ("provider", "status"))
+PROVIDER_RETRIES = metrics.counter("provider_retries_total", "Provider call attempts that failed and were retried.", ("provider",))
+metrics.gauge("provider_in_flight", "Provider calls currently running.", ("provider",),
+              callback=lambda: {(limiter.name,): limiter.in_flight for limiter in list(_limiters)})
+metrics.gauge("provider_waiting", "Provider calls queued for a concurrency slot or rate token.", ("provider",),
+              callback=lambda: {(limiter.name,): limiter.waiting for limiter in list(_limiters)})
+
+class TokenBucket:
+    """Async token bucket: refills at `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+        self._loop = None
+
+    async def acquire(self, tokens: float = 1.0):
+        """Waits until `tokens` are available and takes them. Waiters are served in arrival order."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio primitives belong to one event loop; rebuild them if a new loop uses us.
+            self._lock, self._loop = asyncio.Lock(), loop
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+class ProviderLimiter:
+    """
+    Per-provider guard: at most `max_concurrency` calls in flight and at most
+    `rate_per_second` call starts, with jittered exponential backoff on failures.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rate_per_second: float, burst: float = None,
+                 retries: int = 3, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.name = name
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._loop = None
+        self._bucket = TokenBucket(rate_per_second, burst)
+        self.in_flight = 0
+        self.waiting = 0
+        _limiters.add(self)
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore, self._loop = asyncio.Semaphore(self.max_concurrency), loop
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+            try:
+                await self._bucket.acquire()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Runs `func()` under the limiter, retrying failures with backoff. Re-raises the last error."""
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                async with self:
+                    result = await func()
+                PROVIDER_CALL_SECONDS.observe(time.perf_counter() - start, provider=self.name, status="ok")
+                return result
+            except Exception as e:
+                PROVIDER_CALL_SECONDS.observe(time.perf_counter() - start, provider=self.name, status="error")
+                if attempt == self.retries:
+                    raise
+                PROVIDER_RETRIES.inc(provider=self.name)
+                delay = self.backoff_delay(attempt)
+                print(f"{self.name} call failed (attempt {attempt + 1}): {e}. Retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
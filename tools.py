@@ -1,52 +1,90 @@
 import os
 import json
-from langchain_tavily import TavilySearch
-from langchain_core.tools import tool
+from typing import Optional
+from langchain_core.tools import tool, StructuredTool
+from langchain_core.runnables import RunnableConfig
 import database
+import metrics
+import providers
 import vectorstore
-from offer_service import _offers
-from playwright.async_api import async_playwright
+from offer_catalog import catalog
+from browser_pool import browser_pool
+from search_cache import CachedSearch, format_results
 import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
-web_search_tool = TavilySearch(max_results=4)
+cached_search = CachedSearch(
+    providers.create_web_search_backend(),
+    ttl_seconds=int(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", "900")),
+    max_entries=int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "512")),
+)
+metrics.cache_counters("web_search", cached_search.stats)
+metrics.counter("web_search_coalesced_total", "Web searches that joined an identical in-flight search.",
+                callback=lambda: cached_search.stats()["coalesced"])
+
+extract_images = providers.create_image_extractor()
+
+@tool
+async def web_search_tool(query: str) -> str:
+    """
+    Performs a live web search and returns the top results with their titles, URLs and content.
+    Use this when `get_available_offers` has no pre-fetched offers for the user's request.
+    """
+    try:
+        return format_results(await cached_search.search(query))
+    except Exception as e:
+        print(f"--- Web search failed for '{query}': {e} ---")
+        return f"Error performing web search: {e}"
+
+# Blocking tool bodies run here rather than on the event loop or the unbounded default executor.
+TOOL_THREAD_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("TOOL_THREAD_POOL_SIZE", "8")), thread_name_prefix="tool")
+metrics.gauge("tool_queue_depth", "Blocking tool calls waiting for a worker thread.",
+              callback=lambda: metrics.executor_queue_depth(TOOL_THREAD_POOL))
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs a blocking callable on the bounded tool thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(TOOL_THREAD_POOL, functools.partial(func, *args, **kwargs))
+
+def blocking_tool(func):
+    """Like @tool for a sync function, but its async path is offloaded to TOOL_THREAD_POOL."""
+    # wraps() keeps func's annotations visible, so an injected RunnableConfig parameter still works.
+    @functools.wraps(func)
+    async def coroutine(*args, **kwargs):
+        return await run_blocking(func, *args, **kwargs)
+    return StructuredTool.from_function(func=func, coroutine=coroutine)
 
 @tool
 async def scrape_page_for_images(url: str) -> str:
     """
     Scrapes a single webpage to find and return a list of up to 10 high-quality image URLs.
     Use this specialized tool when a previous search returned a good result but with no image URL.
-    This is a powerful but slow tool, so use it only when necessary.
     """
-    print(f"--- Starting Playwright to scrape images from: {url} ---")
+    print(f"--- Scraping images from: {url} ---")
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()
-            page = await browser.new_page()
-            await page.goto(url, wait_until="networkidle", timeout=15000)
-            
-            # Find all <img> tags, get their 'src' attribute, and filter for valid URLs
-            image_urls = await page.eval_on_all("img", """(images) =>
-                images.map(img => img.src).filter(src => src.startsWith('http'))
-            """)
-            
-            await browser.close()
-            
-            if not image_urls:
-                return "No usable images found on the page."
-            
-            # Return up to the first 10 images found
-            unique_urls = list(dict.fromkeys(image_urls)) # Remove duplicates
-            print(f"--- Found {len(unique_urls)} images from {url} ---")
-            return json.dumps(unique_urls[:10])
+        # Fast path: static og:image / <img> tags from a plain HTTP fetch. Render with Chromium only if that finds nothing.
+        try:
+            unique_urls = await run_blocking(extract_images, url, 10)
+        except Exception as e:
+            print(f"--- Static image extraction failed for {url}: {e} ---")
+            unique_urls = []
+        if not unique_urls:
+            unique_urls = await browser_pool.scrape_images(url, limit=10)
+        if not unique_urls:
+            return "No usable images found on the page."
+        print(f"--- Found {len(unique_urls)} images from {url} ---")
+        return json.dumps(unique_urls)
 
     except Exception as e:
         print(f"--- Playwright scraping failed for {url}: {e} ---")
         return f"Error scraping page: {e}"
 
-@tool
-def get_available_offers(category: str, location: str) -> str:
+@blocking_tool
+def get_available_offers(category: str, location: str, currency: Optional[str] = None, max_price: Optional[float] = None) -> str:
     """
     Looks up available deals and offers for a given category (e.g., 'hotel', 'flight', 'concert') and location.
+    Optionally restrict results to a 3-letter currency code and a maximum offer price.
     """
     print(f"--- Searching for offers with category '{category}' in location '{location}' ---")
     
@@ -67,25 +105,33 @@ def get_available_offers(category: str, location: str) -> str:
 
     print(f"--- Mapped category '{category}' to agent category '{agent_category}' ---")
     try:
-        all_offers = _offers
-        filtered_offers = [
-            offer for offer in all_offers 
-            if offer.get("category") == agent_category and 
-               location.lower() in offer.get("location", "").lower()
-        ]
-        if not filtered_offers:
+        # Imported here so loading the tools doesn't load the offer service and its clients.
+        from offer_service import record_offer_lookup
+        result = catalog.query(agent_category, location, currency=currency, max_price=max_price)
+        record_offer_lookup(agent_category, location, found=result is not None)
+        if result is None:
             return f"No specific offers found for {agent_category} in {location}. You can use the web_search_tool for a general search."
-        return json.dumps(filtered_offers, indent=2)
+        return result
     except Exception as e:
         print(f"An unexpected error occurred while accessing offers: {e}")
         return "An unexpected error occurred while fetching offers."
 
-@tool
-def search_user_emails(query: str) -> str:
-    """Searches a user's emails based on a semantic query to find relevant information."""
-    return vectorstore.search_emails(query)
+@blocking_tool
+def search_user_emails(query: str, sender: Optional[str] = None, date_from: Optional[str] = None,
+                       date_to: Optional[str] = None, k: int = 3, config: RunnableConfig = None) -> str:
+    """
+    Searches a user's emails to find relevant information. Matches both meaning and exact terms
+    such as order numbers or names. Optionally filter by sender email address and by an inclusive
+    ISO date range in UTC (date_from / date_to, e.g. '2024-05-01'), and choose how many results to return (k).
+    """
+    # Only the current user's mailbox is searched; the user comes from the run config set by /chat.
+    user_id = ((config or {}).get("configurable") or {}).get("user_id")
+    try:
+        return vectorstore.search_emails(query, k=k, sender=sender, date_from=date_from, date_to=date_to, user_id=user_id)
+    except ValueError as e:
+        return f"Invalid date filter, use ISO dates like '2024-05-01': {e}"
 
-@tool
+@blocking_tool
 def update_task_status(session_id: str, status: str, details: dict) -> str:
     """Updates the status of the current task or booking in the workflow system."""
     database.update_workflow(session_id, status, details)
@@ -93,4 +139,6 @@ def update_task_status(session_id: str, status: str, details: dict) -> str:
 
 booking_tools = [web_search_tool, get_available_offers, update_task_status, scrape_page_for_images]
 email_agent_tools = [search_user_emails, update_task_status]
-all_tools = booking_tools + email_agent_tools
\ No newline at end of file
+all_tools = booking_tools + email_agent_tools
+# Tools that change state; a turn that called one must not be replayed from a cache.
+side_effect_tool_names = {update_task_status.name}
\ No newline at end of file
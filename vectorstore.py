@@ -1,43 +1,320 @@
-import chromadb
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.documents import Document
 from dotenv import load_dotenv
 import os
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any
+import providers
+from lexical_index import BM25Index, tokenize, is_identifier, reciprocal_rank_fusion
 
 load_dotenv()
 
-client = chromadb.Client() 
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chroma_data")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMAIL_CHUNK_CHARS = int(os.getenv("EMAIL_CHUNK_CHARS", "2000"))
+EMAIL_CHUNK_OVERLAP = int(os.getenv("EMAIL_CHUNK_OVERLAP", "200"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+EMAIL_SEARCH_K = int(os.getenv("EMAIL_SEARCH_K", "3"))
+MAX_LOADED_MAILBOXES = int(os.getenv("MAX_LOADED_MAILBOXES", "64"))
+MAILBOX_IDLE_SECONDS = int(os.getenv("MAILBOX_IDLE_SECONDS", "1800"))
+CHROMA_MEMORY_LIMIT_BYTES = int(os.getenv("CHROMA_MEMORY_LIMIT_BYTES", str(1024 ** 3)))
 
-email_collection = client.get_or_create_collection(
-    name="user_emails",
-    metadata={"hnsw:space": "cosine"} 
-)
+@providers.singleton
+def get_client():
+    """
+    On-disk, so the email index survives restarts and is not re-embedded on startup.
+    Chroma's LRU segment cache unloads the vector indexes of collections not queried recently.
+    Opened on first use.
+    """
+    import chromadb
+    from chromadb.config import Settings
+    return chromadb.PersistentClient(
+        path=CHROMA_PATH,
+        settings=Settings(chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT_BYTES),
+    )
 
-embedding_function = GoogleGenerativeAIEmbeddings(
-    model="models/gemini-embedding-001",
-    google_api_key=os.getenv("GOOGLE_API_KEY")
-)
+_query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+_query_embeddings_lock = threading.Lock()
 
-def add_emails(emails: list[str], ids: list[str]):
-    """Embeds and stores emails in ChromaDB."""
-    email_collection.add(
-        ids=ids,
-        documents=emails,
-    )
-    print(f"Added {len(emails)} emails to the vector store.")
-
-def search_emails(query: str) -> str:
-    """Searches for emails in ChromaDB based on a query."""
-    
-    query_embedding = embedding_function.embed_query(query)
-    
-   
-    results = email_collection.query(
-        query_embeddings=[query_embedding],
-        n_results=3,
-    )
-    
-    if not results or not results.get("documents"):
+def embed_query_cached(query: str) -> List[float]:
+    """embed_query with an LRU cache keyed by the whitespace/case-normalized query."""
+    key = " ".join(query.lower().split())
+    with _query_embeddings_lock:
+        if key in _query_embeddings:
+            _query_embeddings.move_to_end(key)
+            return _query_embeddings[key]
+    embedding = providers.embeddings().embed_query(query)
+    with _query_embeddings_lock:
+        _query_embeddings[key] = embedding
+        while len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+    return embedding
+
+def _timestamp(value: Optional[str], end_of_day: bool = False) -> Optional[int]:
+    """
+    Epoch seconds of an ISO date or datetime; values without a timezone are taken as UTC.
+    With `end_of_day`, a date-only value means the last second of that day (inclusive upper bound).
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end_of_day:
+        try:
+            date.fromisoformat(value)
+            parsed += timedelta(days=1, seconds=-1)
+        except ValueError:
+            pass  # Has a time component: use it as given.
+    return int(parsed.timestamp())
+
+def chunk_text(text: str, max_chars: int = EMAIL_CHUNK_CHARS, overlap: int = EMAIL_CHUNK_OVERLAP) -> List[str]:
+    """Splits long text into overlapping chunks, preferring to break at paragraph or sentence ends."""
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + max_chars)
+        if end < len(text):
+            for sep in ("\n\n", "\n", ". "):
+                cut = text.rfind(sep, start + max_chars // 2, end)
+                if cut != -1:
+                    end = cut + len(sep)
+                    break
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [c for c in chunks if c]
+
+def _prepare_chunks(emails: List[str], ids: List[str], metadatas: Optional[List[Dict[str, Any]]], collection) -> List[dict]:
+    """
+    Chunks the emails and drops chunks already stored. A chunk's id hashes its email id and
+    content, so re-ingesting an unchanged mailbox embeds nothing, while identical text in
+    different emails keeps each email's sender and date.
+    """
+    chunks: Dict[str, dict] = {}
+    for n, (email, email_id) in enumerate(zip(emails, ids)):
+        base_metadata = dict(metadatas[n]) if metadatas else {}
+        if base_metadata.get("date") and "timestamp" not in base_metadata:
+            # Numeric copy of the ISO date so Chroma can range-filter on it.
+            base_metadata["timestamp"] = _timestamp(base_metadata["date"])
+        if base_metadata.get("sender"):
+            base_metadata["sender"] = base_metadata["sender"].lower()
+        for index, chunk in enumerate(chunk_text(email)):
+            chunk_id = hashlib.sha256(f"{email_id}\0{chunk}".encode("utf-8")).hexdigest()
+            chunks.setdefault(chunk_id, {
+                "id": chunk_id,
+                "document": chunk,
+                "metadata": {**base_metadata, "email_id": email_id, "chunk": index},
+            })
+    if not chunks:
+        return []
+    existing = set(collection.get(ids=list(chunks), include=[])["ids"])
+    return [c for key, c in chunks.items() if key not in existing]
+
+def _batches(items: list, size: int) -> List[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _unique_documents(batch: List[dict]) -> List[str]:
+    """Each distinct chunk text once: the same text in several emails is embedded a single time."""
+    return list(dict.fromkeys(c["document"] for c in batch))
+
+def _chunk_embeddings(batch: List[dict], documents: List[str], embeddings: List[List[float]]) -> List[List[float]]:
+    by_document = dict(zip(documents, embeddings))
+    return [by_document[c["document"]] for c in batch]
+
+class EmailIndex:
+    """One mailbox: its Chroma collection plus the BM25 index used for the lexical side of hybrid search."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.last_used = time.monotonic()
+        self._lexical: Optional[BM25Index] = None
+        self._lock = threading.Lock()
+
+    def lexical_index(self) -> BM25Index:
+        """Built from the stored documents (no embedding calls) on first use."""
+        with self._lock:
+            if self._lexical is None:
+                index = BM25Index()
+                stored = self.collection.get(include=["documents", "metadatas"])
+                for doc_id, document, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+                    index.add(doc_id, document, metadata)
+                self._lexical = index
+            return self._lexical
+
+    def store_batch(self, batch: List[dict], embeddings: List[List[float]]):
+        self.collection.add(
+            ids=[c["id"] for c in batch],
+            documents=[c["document"] for c in batch],
+            metadatas=[c["metadata"] for c in batch],
+            embeddings=embeddings,
+        )
+        if self._lexical is not None:
+            for c in batch:
+                self._lexical.add(c["id"], c["document"], c["metadata"])
+
+    def search(self, query: str, k: int = EMAIL_SEARCH_K, sender: Optional[str] = None,
+               date_from: Optional[str] = None, date_to: Optional[str] = None) -> str:
+        """
+        Hybrid search: BM25 over an in-memory inverted index fused with vector similarity
+        (reciprocal rank fusion). Queries naming an exact identifier (order number, email
+        address, ...) that the lexical index matches are answered without an embedding call.
+        `sender` and the ISO `date_from`/`date_to` bounds filter both stages.
+        """
+        where, predicate = _metadata_filter(sender, date_from, date_to)
+        index = self.lexical_index()
+        lexical = index.search(query, k * 2, predicate)
+        lexical_ids = [doc_id for doc_id, _ in lexical]
+
+        identifiers = [t for t in tokenize(query) if is_identifier(t) and index.document_frequency(t)]
+        if identifiers and lexical_ids:
+            top_tokens = set(tokenize(index.docs[lexical_ids[0]][0]))
+            if all(t in top_tokens for t in identifiers):
+                return "\n\n".join(index.docs[doc_id][0] for doc_id in lexical_ids[:k])
+
+        vector_ids, documents = [], {}
+        if self.collection.count():
+            results = self.collection.query(
+                query_embeddings=[embed_query_cached(query)],
+                n_results=k * 2,
+                where=where,
+            )
+            if results and results.get("ids"):
+                vector_ids = results["ids"][0]
+                documents = dict(zip(results["ids"][0], results["documents"][0]))
+
+        fused = reciprocal_rank_fusion([lexical_ids, vector_ids])[:k]
+        if not fused:
+            return "No relevant emails found."
+        return "\n\n".join(documents.get(doc_id) or index.docs[doc_id][0] for doc_id in fused)
+
+def mailbox_collection_name(user_id: str) -> str:
+    """Chroma-safe collection name for a user's (or session's) mailbox."""
+    return f"user_emails_{hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:24]}"
+
+class EmailIndexRouter:
+    """
+    Routes each user to their own mailbox collection, so search cost and results depend only
+    on that user's emails. Mailboxes are opened on first use; those idle for `idle_seconds`,
+    or beyond the `max_loaded` most recently used, are dropped from memory (their data stays on disk).
+    There is no shared mailbox: every lookup needs a user_id.
+    """
+
+    def __init__(self, max_loaded: int = MAX_LOADED_MAILBOXES, idle_seconds: int = MAILBOX_IDLE_SECONDS):
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self._loaded: "OrderedDict[str, EmailIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, create: bool = True) -> Optional[EmailIndex]:
+        """The user's mailbox; None if it doesn't exist and `create` is False."""
+        if not user_id:
+            raise ValueError("A user_id is required to open a mailbox.")
+        with self._lock:
+            self._evict_idle()
+            mailbox = self._loaded.get(user_id)
+            if mailbox is None:
+                if create:
+                    collection = get_client().get_or_create_collection(
+                        name=mailbox_collection_name(user_id),
+                        metadata={"hnsw:space": "cosine"}
+                    )
+                else:
+                    try:
+                        collection = get_client().get_collection(name=mailbox_collection_name(user_id))
+                    except Exception:
+                        return None
+                mailbox = self._loaded[user_id] = EmailIndex(collection)
+                while len(self._loaded) > self.max_loaded:
+                    self._loaded.popitem(last=False)
+            self._loaded.move_to_end(user_id)
+            mailbox.last_used = time.monotonic()
+            return mailbox
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        for user_id in [u for u, m in self._loaded.items() if m.last_used < cutoff]:
+            del self._loaded[user_id]
+
+    def loaded(self) -> int:
+        return len(self._loaded)
+
+mailboxes = EmailIndexRouter()
+
+def add_emails(user_id: str, emails: list[str], ids: list[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+               batch_size: int = EMBED_BATCH_SIZE) -> int:
+    """Embeds and stores emails in the user's mailbox. Returns the number of new chunks stored."""
+    mailbox = mailboxes.get(user_id)
+    new_chunks = _prepare_chunks(emails, ids, metadatas, mailbox.collection)
+    for batch in _batches(new_chunks, batch_size):
+        documents = _unique_documents(batch)
+        embeddings = providers.embeddings().embed_documents(documents)
+        mailbox.store_batch(batch, _chunk_embeddings(batch, documents, embeddings))
+    print(f"Added {len(emails)} emails to the vector store ({len(new_chunks)} new chunks).")
+    return len(new_chunks)
+
+async def aingest_emails(user_id: str, emails: List[str], ids: List[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+                         batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY) -> int:
+    """
+    Bulk variant of add_emails: chunks, dedupes against the store, then embeds batches of
+    `batch_size` chunks with at most `concurrency` embedding requests in flight.
+    Returns the number of new chunks stored.
+    """
+    mailbox = mailboxes.get(user_id)
+    new_chunks = await asyncio.to_thread(_prepare_chunks, emails, ids, metadatas, mailbox.collection)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def embed_and_store(batch: List[dict]):
+        documents = _unique_documents(batch)
+        async with semaphore:
+            embeddings = await providers.embeddings().aembed_documents(documents)
+        await asyncio.to_thread(mailbox.store_batch, batch, _chunk_embeddings(batch, documents, embeddings))
+
+    await asyncio.gather(*(embed_and_store(batch) for batch in _batches(new_chunks, batch_size)))
+    print(f"Ingested {len(emails)} emails into the vector store ({len(new_chunks)} new chunks).")
+    return len(new_chunks)
+
+def _metadata_filter(sender: Optional[str], date_from: Optional[str], date_to: Optional[str]):
+    """Builds the equivalent Chroma `where` clause and in-memory predicate for the optional filters."""
+    clauses = []
+    sender = sender.lower() if sender else None
+    start, end = _timestamp(date_from), _timestamp(date_to, end_of_day=True)
+    if sender:
+        clauses.append({"sender": sender})
+    if start is not None:
+        clauses.append({"timestamp": {"$gte": start}})
+    if end is not None:
+        clauses.append({"timestamp": {"$lte": end}})
+    where = None if not clauses else clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def predicate(metadata: Dict[str, Any]) -> bool:
+        if sender and metadata.get("sender") != sender:
+            return False
+        ts = metadata.get("timestamp")
+        if start is not None and (ts is None or ts < start):
+            return False
+        if end is not None and (ts is None or ts > end):
+            return False
+        return True
+
+    return where, (predicate if clauses else None)
+
+def search_emails(query: str, k: int = EMAIL_SEARCH_K, sender: Optional[str] = None,
+                  date_from: Optional[str] = None, date_to: Optional[str] = None, user_id: Optional[str] = None) -> str:
+    """Searches the user's emails; see EmailIndex.search. Without a user there is nothing to search."""
+    if not user_id:
+        return "No relevant emails found."
+    # k comes from the LLM; Chroma rejects n_results < 1.
+    k = max(1, int(k))
+    mailbox = mailboxes.get(user_id, create=False)
+    if mailbox is None:
         return "No relevant emails found."
-        
-    return "\n\n".join(results["documents"][0])
\ No newline at end of file
+    return mailbox.search(query, k=k, sender=sender, date_from=date_from, date_to=date_to)